@@ -0,0 +1,296 @@
+"""Interchangeable inference engines for the digit classifier.
+
+- keras:  the full TensorFlow/Keras model (reference implementation)
+- tflite: a TFLite interpreter, from a .tflite file or converted from the .keras model
+- numpy:  the Dense layers' weights evaluated as plain matmuls, no TensorFlow needed
+
+Every backend takes a (N, 28, 28, 1) float32 batch and returns (N, 10) probabilities.
+
+Usage:
+    python backends.py --engines keras tflite numpy --samples 2000
+    python backends.py --export-npz best_model.npz
+"""
+import io
+import os
+import json
+import time
+import zipfile
+import threading
+import argparse
+import numpy as np
+
+from preprocessing import PREDICTION_IMAGE_SIZE
+
+DEFAULT_MODEL_PATH = "best_model.keras"
+PARITY_ATOL = 1e-4
+
+
+class InferenceBackend:
+    """Base class: subclasses implement `predict` for a (N, 28, 28, 1) float32 batch."""
+
+    name = None
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def warmup(self):
+        """Run one blank input through the engine so the first real call is not slower."""
+        self.predict(np.zeros((1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1), dtype=np.float32))
+
+
+class KerasBackend(InferenceBackend):
+    """Keras model; single samples use the traced FastPredictor path, batches `predict_on_batch`."""
+
+    name = "keras"
+
+    def __init__(self, model=None):
+        from inference import FastPredictor, load_digit_model
+        if model is None or isinstance(model, str):
+            model = load_digit_model(model)
+        self.model = model
+        self.fast_predictor = FastPredictor(model)
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        if len(batch) == 1:
+            return self.fast_predictor.predict(batch)[np.newaxis]
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+def load_tflite_interpreter(model_content=None, model_path=None):
+    """Create a TFLite interpreter, preferring the TF-free LiteRT / `tflite_runtime` packages."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_content=model_content, model_path=model_path)
+
+
+def convert_to_tflite(model_path, optimizations=None, supported_types=None, representative_dataset=None,
+                      integer_io=False):
+    """Convert a .keras model to a TFLite flatbuffer (bytes). Needs TensorFlow."""
+    import tensorflow as tf
+    from inference import load_digit_model
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(load_digit_model(model_path))
+    if optimizations:
+        converter.optimizations = optimizations
+    if supported_types:
+        converter.target_spec.supported_types = supported_types
+    if representative_dataset is not None:
+        converter.representative_dataset = representative_dataset
+    if integer_io:
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    return converter.convert()
+
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite interpreter; handles float and full-integer (quantized input/output) models."""
+
+    name = "tflite"
+
+    def __init__(self, model_path=None):
+        model_path = model_path or DEFAULT_MODEL_PATH
+        if model_path.lower().endswith(".tflite"):
+            self.interpreter = load_tflite_interpreter(model_path=model_path)
+        else:
+            self.interpreter = load_tflite_interpreter(model_content=convert_to_tflite(model_path))
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input_details["shape"][0])
+        # One interpreter is not thread-safe, and the app predicts from two worker threads
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size != self.batch_size:
+            shape = [batch_size] + list(self.input_details["shape"][1:])
+            self.interpreter.resize_tensor_input(self.input_details["index"], shape)
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()[0]
+            self.output_details = self.interpreter.get_output_details()[0]
+            self.batch_size = batch_size
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            self._resize(len(batch))
+            batch = batch.reshape(self.input_details["shape"])
+
+            input_dtype = self.input_details["dtype"]
+            if input_dtype != np.float32:
+                scale, zero_point = self.input_details["quantization"]
+                info = np.iinfo(input_dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(input_dtype)
+            self.interpreter.set_tensor(self.input_details["index"], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_details["index"])
+
+        if self.output_details["dtype"] != np.float32:
+            scale, zero_point = self.output_details["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def read_keras_dense_weights(model_path):
+    """Read a .keras archive's Dense layers as [(kernel, bias, activation), ...] without TensorFlow.
+
+    Only the layer types of the training notebook's model are supported (Flatten, Dense, Dropout).
+    """
+    import h5py
+
+    with zipfile.ZipFile(model_path) as archive:
+        config = json.loads(archive.read("config.json"))
+        weights_file = h5py.File(io.BytesIO(archive.read("model.weights.h5")), "r")
+
+    layers = []
+    with weights_file:
+        for layer in config["config"]["layers"]:
+            kind, layer_config = layer["class_name"], layer["config"]
+            if kind in ("InputLayer", "Flatten", "Dropout"):
+                continue
+            if kind != "Dense":
+                raise ValueError(f"The numpy backend does not support {kind} layers")
+            variables = weights_file[f"layers/{layer_config['name']}/vars"]
+            kernel = np.asarray(variables["0"], dtype=np.float32)
+            bias = (np.asarray(variables["1"], dtype=np.float32) if layer_config.get("use_bias", True)
+                    else np.zeros(kernel.shape[1], dtype=np.float32))
+            layers.append((kernel, bias, layer_config.get("activation", "linear")))
+    return layers
+
+
+def export_numpy_weights(model_path, npz_path):
+    """Write the Dense weights to a .npz so the numpy backend does not even need h5py."""
+    layers = read_keras_dense_weights(model_path)
+    arrays = {}
+    for i, (kernel, bias, activation) in enumerate(layers):
+        arrays[f"kernel_{i}"] = kernel
+        arrays[f"bias_{i}"] = bias
+        arrays[f"activation_{i}"] = np.array(activation)
+    np.savez(npz_path, **arrays)
+
+
+def load_numpy_weights(npz_path):
+    with np.load(npz_path) as data:
+        count = len([key for key in data.files if key.startswith("kernel_")])
+        return [(data[f"kernel_{i}"], data[f"bias_{i}"], str(data[f"activation_{i}"])) for i in range(count)]
+
+
+class NumpyBackend(InferenceBackend):
+    """Pure NumPy forward pass of the Dense(512, relu) + Dense(10, softmax) classifier."""
+
+    name = "numpy"
+
+    ACTIVATIONS = {
+        "linear": lambda x: x,
+        "relu": lambda x: np.maximum(x, 0, out=x),
+    }
+
+    def __init__(self, model_path=None):
+        model_path = model_path or DEFAULT_MODEL_PATH
+        if model_path.lower().endswith(".npz"):
+            self.layers = load_numpy_weights(model_path)
+        else:
+            self.layers = read_keras_dense_weights(model_path)
+        for _, _, activation in self.layers:
+            if activation not in self.ACTIVATIONS and activation != "softmax":
+                raise ValueError(f"The numpy backend does not support the {activation} activation")
+
+    def predict(self, batch):
+        x = np.asarray(batch, dtype=np.float32).reshape(len(batch), -1)
+        for kernel, bias, activation in self.layers:
+            x = x @ kernel
+            x += bias
+            if activation == "softmax":
+                x -= x.max(axis=1, keepdims=True)
+                np.exp(x, out=x)
+                x /= x.sum(axis=1, keepdims=True)
+            else:
+                x = self.ACTIVATIONS[activation](x)
+        return x
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+    "numpy": NumpyBackend,
+}
+
+
+def default_backend_name(model_path):
+    """Pick the engine implied by the model file's extension."""
+    extension = os.path.splitext(model_path or "")[1].lower()
+    return {".tflite": "tflite", ".npz": "numpy"}.get(extension, "keras")
+
+
+def create_backend(name=None, model_path=None):
+    """Instantiate an engine by name ('keras', 'tflite', 'numpy'); defaults from the model file."""
+    name = name or default_backend_name(model_path)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_path)
+
+
+def check_parity(backends, batch, reference=None, atol=PARITY_ATOL):
+    """Compare every backend against `reference` (default: the first) on the same batch.
+
+    Returns {name: {"max_abs_diff", "argmax_agreement", "within_tolerance"}}.
+    """
+    reference = reference or backends[0]
+    expected = reference.predict(batch)
+    report = {}
+    for backend in backends:
+        actual = backend.predict(batch)
+        max_diff = float(np.max(np.abs(actual - expected)))
+        report[backend.name] = {
+            "max_abs_diff": max_diff,
+            "argmax_agreement": float(np.mean(actual.argmax(axis=1) == expected.argmax(axis=1))),
+            "within_tolerance": max_diff <= atol,
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare inference backends or export NumPy weights.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--engines", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--data", nargs="*", help="Digit images/directories/.npy stacks (default: random inputs)")
+    parser.add_argument("--samples", type=int, default=1000, help="Number of random inputs when --data is not given")
+    parser.add_argument("--atol", type=float, default=PARITY_ATOL)
+    parser.add_argument("--export-npz", help="Write the model's weights for the numpy backend and exit")
+    args = parser.parse_args(argv)
+
+    if args.export_npz:
+        export_numpy_weights(args.model, args.export_npz)
+        print(f"NumPy weights written to {args.export_npz}")
+        return
+
+    if args.data:
+        from inference import load_digits
+        from preprocessing import to_model_input
+        _, images, _ = load_digits(args.data)
+        batch = to_model_input(images)
+    else:
+        batch = np.random.default_rng(0).random(
+            (args.samples, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1), dtype=np.float32)
+
+    backends = []
+    for name in args.engines:
+        start = time.perf_counter()
+        backends.append(create_backend(name, args.model))
+        print(f"{name:>6}: loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for name, stats in check_parity(backends, batch, atol=args.atol).items():
+        status = "OK" if stats["within_tolerance"] else "MISMATCH"
+        print(f"{name:>6}: max |diff| {stats['max_abs_diff']:.2e} | "
+              f"argmax agreement {stats['argmax_agreement'] * 100:.2f}% | {status}")
+
+
+if __name__ == "__main__":
+    main()
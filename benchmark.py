@@ -0,0 +1,379 @@
+"""Reproducible benchmark of the inference path: preprocessing, model and chart rendering.
+
+Fixtures are the drawings in the bundled screenshots (`no_*.PNG`, `uk_*.PNG`, `empty.PNG`,
+cut back out of the app's guide box) plus seeded synthetic brush strokes. Each stage is
+timed separately, the model is measured across batch sizes, and memory is sampled; the
+results are written as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py --output bench_results.json
+    python benchmark.py --backends keras numpy --compare bench_results.json
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import platform
+import argparse
+import itertools
+import tracemalloc
+import numpy as np
+from datetime import datetime
+from PIL import Image, ImageDraw
+
+from preprocessing import (CANVAS_SIZE, GUIDE_BOX_REGION, GUIDE_BOX_WIDTH, GUIDE_BOX_HEIGHT,
+                           GUIDE_BOX_START_X, GUIDE_BOX_START_Y, PREDICTION_IMAGE_SIZE, IncrementalRaster,
+                           is_blank_canvas, mnist_normalize, normalize_canvas_image, preprocess_canvas_image,
+                           to_model_input)
+from instrumentation import current_rss_mb
+from strokes import Stroke, StrokeHistory, simplify_points
+
+SAMPLE_PATTERNS = ("no_*.PNG", "uk_*.PNG", "empty.PNG")
+BATCH_SIZES = (1, 8, 32, 128, 512, 2048)
+DEFAULT_REPEATS = 200
+REGRESSION_THRESHOLD = 0.20  # Flag stages more than 20% slower than the baseline
+
+
+# --- Fixtures ---
+def extract_canvas_from_screenshot(screenshot):
+    """Rebuild the 280x280 drawing canvas from an app screenshot using the green guide box."""
+    rgb = np.array(screenshot.convert("RGB")).astype(np.int16)
+    guide_mask = (np.abs(rgb[..., 1] - 128) < 20) & (rgb[..., 0] < 30) & (rgb[..., 2] < 30)
+    ys, xs = np.nonzero(guide_mask)
+    if len(xs) == 0:
+        return None
+
+    gray = np.array(screenshot.convert("L"))
+    gray[guide_mask] = 255  # Erase the dashed guide outline itself
+    scale = (xs.max() - xs.min()) / GUIDE_BOX_WIDTH
+    margin = int(np.ceil(2 * scale))  # The outline is 2 canvas pixels wide
+    inner = gray[ys.min() + margin:ys.max() - margin + 1, xs.min() + margin:xs.max() - margin + 1]
+    guide_box = Image.fromarray(inner).resize((GUIDE_BOX_WIDTH, GUIDE_BOX_HEIGHT), Image.Resampling.LANCZOS)
+
+    canvas = Image.new("L", (CANVAS_SIZE, CANVAS_SIZE), "white")
+    canvas.paste(guide_box, (GUIDE_BOX_START_X, GUIDE_BOX_START_Y))
+    return canvas
+
+
+def label_from_filename(path):
+    """`no_4.PNG` / `uk_8.PNG` -> 4 / 8; files without a digit (e.g. `empty.PNG`) -> None."""
+    match = re.search(r"_(\d)\.", os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def load_sample_fixtures(directory=None):
+    """Return [(name, canvas, label)] for the bundled screenshots that show the drawing canvas."""
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    fixtures = []
+    for pattern in SAMPLE_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(directory, pattern))):
+            with Image.open(path) as screenshot:
+                canvas = extract_canvas_from_screenshot(screenshot)
+            if canvas is not None:
+                fixtures.append((os.path.basename(path), canvas, label_from_filename(path)))
+    return fixtures
+
+
+def synthetic_strokes(count, seed=0, segments=40):
+    """Seeded random-walk strokes, returned as [(canvas, [(x0, y0, x1, y1, width), ...])]."""
+    rng = np.random.default_rng(seed)
+    drawings = []
+    for _ in range(count):
+        canvas = Image.new("L", (CANVAS_SIZE, CANVAS_SIZE), "white")
+        draw = ImageDraw.Draw(canvas)
+        width = int(rng.integers(10, 31))  # Same range as the app's brush slider
+        x, y = rng.integers(GUIDE_BOX_START_X + 30, GUIDE_BOX_START_X + GUIDE_BOX_WIDTH - 30, size=2)
+        segments_drawn = []
+        for _ in range(segments):
+            nx = int(np.clip(x + rng.integers(-12, 13), GUIDE_BOX_START_X, GUIDE_BOX_START_X + GUIDE_BOX_WIDTH))
+            ny = int(np.clip(y + rng.integers(-12, 13), GUIDE_BOX_START_Y, GUIDE_BOX_START_Y + GUIDE_BOX_HEIGHT))
+            draw.line([x, y, nx, ny], fill="black", width=width, joint="round")
+            segments_drawn.append((x, y, nx, ny, width))
+            x, y = nx, ny
+        drawings.append((canvas, segments_drawn))
+    return drawings
+
+
+# --- Measurement helpers ---
+def time_calls(fn, repeats, warmup=5):
+    """Run `fn` repeatedly and return latency statistics in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples[i] = (time.perf_counter() - start) * 1000.0
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p90_ms": float(np.percentile(samples, 90)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "runs": repeats,
+    }
+
+
+def peak_allocation_kb(fn):
+    """Peak Python-level allocation of one call to `fn` (tracemalloc), in KiB."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024.0
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_preprocess(canvas):
+    """The original guide-box pipeline: LANCZOS resize to 28x28 instead of 8x8 block means."""
+    img = canvas.convert("L").crop(GUIDE_BOX_REGION).resize(
+        (PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE), Image.Resampling.LANCZOS)
+    return 255 - np.array(img)
+
+
+# --- Stages ---
+def bench_preprocessing(canvases, strokes, repeats):
+    results = {}
+    canvas_cycle = itertools.cycle(canvases)
+
+    def next_canvas():
+        return next(canvas_cycle)
+
+    results["blank_check"] = time_calls(lambda: is_blank_canvas(next_canvas()), repeats)
+    results["full_preprocess"] = time_calls(lambda: preprocess_canvas_image(next_canvas()), repeats)
+    results["legacy_array_blank_check"] = time_calls(lambda: np.all(np.array(next_canvas()) == 255), repeats)
+
+    results["legacy_lanczos_preprocess"] = time_calls(lambda: legacy_preprocess(next_canvas()), repeats)
+
+    # MNIST-style fit and center-of-mass centering: one canvas, then a whole batch per call
+    results["mnist_normalize"] = time_calls(lambda: normalize_canvas_image(next_canvas()), repeats)
+    ink_batch = 255 - np.stack([np.array(canvas) for canvas in canvases])
+    results["mnist_normalize_batch"] = time_calls(lambda: mnist_normalize(ink_batch), max(3, repeats // 10))
+    results["mnist_normalize_batch"]["batch_size"] = len(ink_batch)
+    results["mnist_normalize_batch"]["per_image_ms"] = results["mnist_normalize_batch"]["p50_ms"] / len(ink_batch)
+
+    # Incremental update after each new segment, as the live drawing path does it
+    canvas, segments = strokes[0]
+    raster = IncrementalRaster()
+    segment_cycle = itertools.cycle(segments)
+
+    def incremental_step():
+        x0, y0, x1, y1, width = next(segment_cycle)
+        raster.mark_line(x0, y0, x1, y1, width)
+        raster.update(canvas)
+
+    results["incremental_update"] = time_calls(incremental_step, repeats)
+
+    def incremental_normalize_step():
+        x0, y0, x1, y1, width = next(segment_cycle)
+        raster.mark_line(x0, y0, x1, y1, width)
+        raster.normalized(canvas)
+
+    results["incremental_normalize"] = time_calls(incremental_normalize_step, repeats)
+
+    # Stroke release: simplify the recorded points, then re-render the raster from the strokes
+    points = [segments[0][:2]] + [segment[2:4] for segment in segments]
+    results["stroke_simplify"] = time_calls(lambda: simplify_points(points), repeats)
+    results["stroke_simplify"]["points_kept"] = len(simplify_points(points)) / len(points)
+    history = StrokeHistory()
+    for _, drawing_segments in strokes:
+        history.strokes.append(Stroke(drawing_segments[0][4], [drawing_segments[0][:2]] +
+                                      [segment[2:4] for segment in drawing_segments]))
+    results["stroke_render"] = time_calls(history.render, repeats)
+    # Stroke release: only the released stroke's box is redrawn
+    stroke_cycle = itertools.cycle(history.strokes)
+    release_image = history.render()
+    results["stroke_render_region"] = time_calls(
+        lambda: history.render_region(release_image, next(stroke_cycle).bbox()), repeats)
+    sample = preprocess_canvas_image(canvases[0])
+    results["normalize"] = time_calls(lambda: to_model_input(sample), repeats)
+    results["full_preprocess"]["peak_alloc_kb"] = peak_allocation_kb(lambda: preprocess_canvas_image(canvases[0]))
+    return results
+
+
+def sample_accuracy(backend, fixtures):
+    """Accuracy on the labelled sample drawings for each preprocessing.
+
+    `guide_box` (8x8 block means) and `guide_box_lanczos` (the original resize) are the two
+    uncentered inputs, `mnist_normalize` is the centered one the app uses by default.
+    """
+    labelled = [(canvas, label) for _, canvas, label in fixtures if label is not None]
+    if not labelled:
+        return {}
+    labels = np.array([label for _, label in labelled])
+    inputs = {
+        "guide_box": np.stack([preprocess_canvas_image(canvas) for canvas, _ in labelled]),
+        "guide_box_lanczos": np.stack([legacy_preprocess(canvas) for canvas, _ in labelled]),
+        "mnist_normalize": np.stack([normalize_canvas_image(canvas) for canvas, _ in labelled]),
+    }
+    return {name: float(np.mean(np.argmax(backend.predict(to_model_input(images)), axis=1) == labels))
+            for name, images in inputs.items()}
+
+
+def bench_model(backend_name, model_path, images, repeats, batch_sizes, fixtures=()):
+    from backends import create_backend
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    backend = create_backend(backend_name, model_path)
+    backend.warmup()
+    load_ms = (time.perf_counter() - start) * 1000.0
+
+    single = to_model_input(images[:1])
+    result = {
+        "load_ms": load_ms,
+        "rss_delta_mb": current_rss_mb() - rss_before,
+        "single_sample": time_calls(lambda: backend.predict(single), repeats),
+        "batch_scaling": [],
+        "sample_accuracy": sample_accuracy(backend, fixtures),
+    }
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        batch = to_model_input(images[rng.integers(0, len(images), size=batch_size)])
+        runs = max(3, min(repeats, 20000 // batch_size))
+        stats = time_calls(lambda: backend.predict(batch), runs, warmup=2)
+        stats["batch_size"] = batch_size
+        stats["images_per_second"] = batch_size / (stats["p50_ms"] / 1000.0)
+        result["batch_scaling"].append(stats)
+    return result
+
+
+def bench_render(repeats):
+    """Time the probability chart on the Agg backend (no window needed).
+
+    `full_redraw` is the original per-prediction redraw (clear, 10 bars, 10 labels, axes
+    setup, full draw), `blit_update` the persistent ProbabilityChart the app now uses.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from probability_chart import BACKGROUND_COLOR, ProbabilityChart, configure_chart_axes
+
+    def make_figure():
+        figure = Figure(figsize=(5, 4), dpi=100, facecolor=BACKGROUND_COLOR)
+        return figure, FigureCanvasAgg(figure), figure.add_subplot(111)
+
+    rng = np.random.default_rng(0)
+    vector_cycle = itertools.cycle(rng.dirichlet(np.ones(10) * 0.3, size=64))
+
+    _, full_canvas, full_ax = make_figure()
+
+    def full_redraw():
+        probabilities = next(vector_cycle)
+        full_ax.clear()
+        bars = full_ax.bar(range(10), probabilities, color='#4CAF50')
+        bars[int(np.argmax(probabilities))].set_color('#2196F3')
+        for i, v in enumerate(probabilities):
+            full_ax.text(i, v + 0.02, f"{v:.2f}", color='black', ha='center', fontsize=8)
+        configure_chart_axes(full_ax)
+        full_canvas.draw()
+
+    blit_figure, blit_canvas, blit_ax = make_figure()
+    chart = ProbabilityChart(blit_figure, blit_ax, blit_canvas)
+    blit_canvas.draw()  # Caches the static background, as the first show does in the app
+
+    return {
+        "full_redraw": time_calls(full_redraw, repeats, warmup=3),
+        "blit_update": time_calls(lambda: chart.update(next(vector_cycle)), repeats, warmup=3),
+    }
+
+
+# --- Reporting ---
+def flatten_latencies(results, prefix=""):
+    """{'stage.name': p50_ms} for every timed entry, used to compare two runs."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if "p50_ms" in value:
+                flat[prefix + key] = value["p50_ms"]
+            else:
+                flat.update(flatten_latencies(value, f"{prefix}{key}."))
+        elif isinstance(value, list):
+            for entry in value:
+                if isinstance(entry, dict) and "batch_size" in entry:
+                    flat[f"{prefix}{key}.{entry['batch_size']}"] = entry["p50_ms"]
+    return flat
+
+
+def compare_runs(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return [(stage, baseline_ms, current_ms, ratio)] for stages slower than the threshold."""
+    now, before = flatten_latencies(current["stages"]), flatten_latencies(baseline["stages"])
+    regressions = []
+    for stage, current_ms in sorted(now.items()):
+        baseline_ms = before.get(stage)
+        if baseline_ms and current_ms > baseline_ms * (1 + threshold):
+            regressions.append((stage, baseline_ms, current_ms, current_ms / baseline_ms))
+    return regressions
+
+
+def run_benchmarks(backends, model_path, repeats, batch_sizes, include_render=True):
+    fixtures = load_sample_fixtures()
+    strokes = synthetic_strokes(32)
+    canvases = [canvas for _, canvas, _ in fixtures] + [canvas for canvas, _ in strokes]
+    images = np.stack([preprocess_canvas_image(canvas) for canvas in canvases])
+
+    stages = {"preprocess": bench_preprocessing(canvases, strokes, repeats), "model": {}}
+    for name in backends:
+        stages["model"][name] = bench_model(name, model_path, images, repeats, batch_sizes, fixtures)
+    if include_render:
+        stages["render"] = bench_render(max(20, repeats // 4))
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "model": model_path,
+            "repeats": repeats,
+            "fixtures": [name for name, _, _ in fixtures],
+            "synthetic_strokes": len(strokes),
+            "peak_rss_mb": current_rss_mb(),
+        },
+        "stages": stages,
+    }
+
+
+def print_summary(results):
+    for stage, p50 in flatten_latencies(results["stages"]).items():
+        print(f"{stage:<45}{p50:>10.3f} ms (p50)")
+    for name, model in results["stages"]["model"].items():
+        for preprocessing, accuracy in model["sample_accuracy"].items():
+            print(f"{f'model.{name} sample accuracy ({preprocessing})':<45}{accuracy * 100:>10.1f} %")
+    print(f"{'process RSS':<45}{results['metadata']['peak_rss_mb']:>10.1f} MiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, model and chart rendering.")
+    parser.add_argument("--model", default="best_model.keras")
+    parser.add_argument("--backends", nargs="+", default=["keras"], choices=["keras", "tflite", "numpy"])
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(BATCH_SIZES))
+    parser.add_argument("--no-render", action="store_true", help="Skip the matplotlib chart stage")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Baseline results JSON; exit 1 if any stage regressed")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.backends, args.model, args.repeats, args.batch_sizes,
+                             include_render=not args.no_render)
+    print_summary(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_runs(results, baseline, args.threshold)
+        for stage, before, now, ratio in regressions:
+            print(f"REGRESSION {stage}: {before:.3f} ms -> {now:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Load MNIST-format digit datasets from local files (no downloads) and store them compactly.
+
+Supported inputs:
+- a directory with the IDX files (`train-images-idx3-ubyte[.gz]`, `t10k-labels-idx1-ubyte[.gz]`, ...)
+- a `.npz` archive in the `keras.datasets.mnist` layout (`x_train`, `y_train`, `x_test`, `y_test`)
+  or with plain `images` / `labels` arrays
+- directories of digit images such as ~/saved_digits (labelled by a digit-named parent
+  folder, e.g. `saved_digits/7/digit_....png`, otherwise unlabelled)
+
+DigitStore keeps everything as raw uint8 files that are memory-mapped on open, so training
+and evaluation stream normalized batches without loading or converting the whole set.
+
+Usage:
+    python digit_dataset.py ingest data/train ~/datasets/mnist ~/saved_digits --split train
+    python digit_dataset.py info data/train
+    python digit_dataset.py evaluate data/test --model best_model.keras
+"""
+import os
+import gzip
+import json
+import argparse
+import numpy as np
+
+from preprocessing import PREDICTION_IMAGE_SIZE
+
+UNLABELED = 255
+INGEST_CHUNK_SIZE = 4096
+
+IDX_DTYPES = {
+    0x08: np.uint8,
+    0x09: np.int8,
+    0x0B: np.dtype(">i2"),
+    0x0C: np.dtype(">i4"),
+    0x0D: np.dtype(">f4"),
+    0x0E: np.dtype(">f8"),
+}
+IDX_PREFIXES = {"train": "train", "test": "t10k"}
+
+
+def read_idx(path):
+    """Read an IDX file (optionally gzipped) into a NumPy array."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        data = f.read()
+    if data[0] != 0 or data[1] != 0:
+        raise ValueError(f"{path} is not an IDX file")
+    dtype, ndim = IDX_DTYPES[data[2]], data[3]
+    shape = tuple(int.from_bytes(data[4 + 4 * i:8 + 4 * i], "big") for i in range(ndim))
+    return np.frombuffer(data, dtype=dtype, offset=4 + 4 * ndim).reshape(shape)
+
+
+def find_idx_file(directory, split, kind):
+    """Locate e.g. the test images as `t10k-images-idx3-ubyte` or `t10k-images.idx3-ubyte(.gz)`."""
+    prefix = IDX_PREFIXES[split]
+    for name in sorted(os.listdir(directory)):
+        normalized = name.replace(".", "-")
+        if normalized.startswith(f"{prefix}-{kind}-idx"):
+            return os.path.join(directory, name)
+    raise FileNotFoundError(f"No {split} {kind} IDX file in {directory}")
+
+
+def load_labeled_digits(path, split="test"):
+    """Return (images uint8 (N, 28, 28), labels uint8 (N,)) for one split of a local dataset."""
+    path = os.path.expanduser(path)
+    if os.path.isdir(path):
+        images = read_idx(find_idx_file(path, split, "images"))
+        labels = read_idx(find_idx_file(path, split, "labels"))
+    elif path.endswith(".npz"):
+        with np.load(path) as data:
+            short = "train" if split == "train" else "test"
+            if f"x_{short}" in data.files:
+                images, labels = data[f"x_{short}"], data[f"y_{short}"]
+            else:
+                images, labels = data["images"], data["labels"]
+    else:
+        raise ValueError(f"Unsupported dataset {path}: expected a directory of IDX files or a .npz archive")
+
+    if len(images) != len(labels):
+        raise ValueError(f"{path}: {len(images)} images but {len(labels)} labels")
+    return np.asarray(images, dtype=np.uint8), np.asarray(labels, dtype=np.uint8)
+
+
+class DigitStore:
+    """Append-only on-disk digit dataset: `images.u8` (N x 28 x 28), `labels.u8` (N) and `meta.json`.
+
+    Every column is a raw file mapped read-only with np.memmap on open; slicing a store returns
+    views into the mapping, and `batches` only converts the batch it is about to yield to float32.
+    Subclasses add columns by extending COLUMNS.
+    """
+
+    IMAGES_FILE = "images.u8"
+    LABELS_FILE = "labels.u8"
+    META_FILE = "meta.json"
+    IMAGE_SHAPE = (PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE)
+    # Attribute name -> (file, dtype, shape of one row)
+    COLUMNS = {
+        "images": (IMAGES_FILE, np.uint8, IMAGE_SHAPE),
+        "labels": (LABELS_FILE, np.uint8, ()),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, self.META_FILE)) as f:
+            self.meta = json.load(f)
+        self.count = self.meta["count"]
+        for name, (filename, dtype, shape) in self.COLUMNS.items():
+            setattr(self, name, self._map(filename, dtype, (self.count,) + shape))
+
+    def _map(self, filename, dtype, shape):
+        if self.count == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, filename), dtype=dtype, mode="r", shape=shape)
+
+    @classmethod
+    def create(cls, path):
+        """Create an empty store (or open an existing one) at `path`."""
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(os.path.join(path, cls.META_FILE)):
+            for filename, _, _ in cls.COLUMNS.values():
+                open(os.path.join(path, filename), "wb").close()
+            with open(os.path.join(path, cls.META_FILE), "w") as f:
+                json.dump({"count": 0, "image_shape": list(cls.IMAGE_SHAPE), "sources": []}, f, indent=2)
+        return cls(path)
+
+    def append(self, images, labels=None, source=None):
+        """Append (N, 28, 28) uint8 images and their labels (UNLABELED where unknown)."""
+        if labels is None:
+            labels = np.full(len(images), UNLABELED, dtype=np.uint8)
+        self.append_columns({"images": images, "labels": labels}, source)
+
+    def append_columns(self, columns, source=None):
+        """Append one array per column (all with the same number of rows)."""
+        arrays = {}
+        for name, (filename, dtype, shape) in self.COLUMNS.items():
+            array = np.ascontiguousarray(columns[name], dtype=dtype)
+            if array.shape[1:] != shape:
+                raise ValueError(f"Column {name}: expected rows of shape {shape}, got {array.shape[1:]}")
+            arrays[filename] = array
+        rows = {len(array) for array in arrays.values()}
+        if len(rows) != 1:
+            raise ValueError(f"Columns have different lengths: {sorted(rows)}")
+
+        for filename, array in arrays.items():
+            with open(os.path.join(self.path, filename), "r+b") as f:
+                # Bytes past the recorded count are left over from an interrupted append: drop them,
+                # otherwise every later row would pair one column's orphan with another's new data
+                f.truncate(self.count * array.itemsize * int(np.prod(array.shape[1:])))
+                f.seek(0, os.SEEK_END)
+                f.write(array.tobytes())
+
+        # meta.json is written last, so the recorded count only ever covers complete rows
+        self.meta["count"] = self.count + rows.pop()
+        if source and source not in self.meta["sources"]:
+            self.meta["sources"].append(source)
+        meta_path = os.path.join(self.path, self.META_FILE)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(meta_path + ".tmp", meta_path)
+        self.__init__(self.path)
+
+    def __len__(self):
+        return self.count
+
+    def labeled_indices(self):
+        return np.flatnonzero(self.labels != UNLABELED)
+
+    def batches(self, batch_size=128, shuffle=False, seed=None, indices=None, labeled_only=True, epochs=1):
+        """Yield (x float32 (B, 28, 28, 1) in [0, 1], y uint8 (B,)) batches straight from the mapping.
+
+        Unshuffled batches over contiguous rows are views into the memmap until normalization;
+        shuffled batches read their rows in sorted order to keep disk access sequential.
+        """
+        if indices is None and labeled_only and np.any(self.labels == UNLABELED):
+            indices = self.labeled_indices()
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = indices if indices is not None else None
+            if shuffle:
+                order = rng.permutation(order if order is not None else self.count)
+            total = self.count if order is None else len(order)
+            for start in range(0, total, batch_size):
+                if order is None:
+                    images = self.images[start:start + batch_size]
+                    labels = self.labels[start:start + batch_size]
+                else:
+                    rows = np.sort(order[start:start + batch_size]) if shuffle else order[start:start + batch_size]
+                    images, labels = self.images[rows], self.labels[rows]
+                x = np.multiply(images, 1.0 / 255.0, dtype=np.float32)
+                yield x.reshape(-1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1), np.asarray(labels)
+
+    def info(self):
+        labeled = self.labels[self.labels != UNLABELED]
+        return {
+            "path": self.path,
+            "count": self.count,
+            "labeled": int(len(labeled)),
+            "per_digit": np.bincount(labeled, minlength=10).tolist(),
+            "size_bytes": self.count * (PREDICTION_IMAGE_SIZE * PREDICTION_IMAGE_SIZE + 1),
+            "sources": self.meta["sources"],
+        }
+
+
+def label_from_directory(path):
+    """`.../7/digit_x.png` -> 7; images not in a digit-named folder are unlabeled."""
+    parent = os.path.basename(os.path.dirname(path))
+    return int(parent) if parent.isdigit() and len(parent) == 1 else UNLABELED
+
+
+def ingest_images(store, source, chunk_size=INGEST_CHUNK_SIZE, workers=None):
+    """Preprocess image files (recursively) with the app's pipeline and append them in chunks.
+
+    Each chunk is decoded in parallel. Returns (digits added, [(path, error)] of unreadable files).
+    """
+    from inference import IMAGE_EXTENSIONS, load_digits
+
+    source = os.path.expanduser(source)
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(source)
+                   for name in names if name.lower().endswith(IMAGE_EXTENSIONS))
+    added, failed = 0, []
+    for start in range(0, len(paths), chunk_size):
+        names, images, chunk_failed = load_digits(paths[start:start + chunk_size], workers)
+        failed.extend(chunk_failed)
+        if len(images):
+            labels = np.array([label_from_directory(name) for name in names], dtype=np.uint8)
+            store.append(images, labels, source=source)
+            added += len(images)
+    return added, failed
+
+
+def is_idx_directory(path):
+    return os.path.isdir(path) and any("idx" in name for name in os.listdir(path))
+
+
+def ingest(store_path, sources, split="train", chunk_size=INGEST_CHUNK_SIZE, workers=None):
+    """Add IDX directories, .npz archives and image folders to the store at `store_path`.
+
+    Image files that cannot be read are skipped and listed, not fatal.
+    """
+    store = DigitStore.create(store_path)
+    for source in sources:
+        source = os.path.expanduser(source)
+        if source.endswith(".npz") or is_idx_directory(source):
+            images, labels = load_labeled_digits(source, split)
+            for start in range(0, len(images), chunk_size):
+                store.append(images[start:start + chunk_size], labels[start:start + chunk_size],
+                             source=f"{source}:{split}")
+            added = len(images)
+        else:
+            added, failed = ingest_images(store, source, chunk_size, workers)
+            for path, error in failed:
+                print(f"Skipped {path}: {error}")
+        print(f"{source}: {added} digits")
+    return store
+
+
+def evaluate(store, backend, batch_size=1024):
+    """Stream the labelled part of `store` through `backend`; returns (accuracy, per-digit accuracy)."""
+    correct = np.zeros(10)
+    totals = np.zeros(10)
+    for x, y in store.batches(batch_size):
+        predictions = np.argmax(backend.predict(x), axis=1)
+        totals += np.bincount(y, minlength=10)[:10]
+        correct += np.bincount(y[predictions == y], minlength=10)[:10]
+    accuracy = correct.sum() / totals.sum() if totals.sum() else float("nan")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return float(accuracy), correct / totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and inspect memory-mapped digit datasets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Append sources to a store (created if missing)")
+    ingest_parser.add_argument("store")
+    ingest_parser.add_argument("sources", nargs="+", help="IDX directories, .npz archives or image folders")
+    ingest_parser.add_argument("--split", default="train", choices=["train", "test"])
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Threads used to decode images (default: CPU count)")
+
+    info_parser = commands.add_parser("info", help="Show the size and label distribution of a store")
+    info_parser.add_argument("store")
+
+    eval_parser = commands.add_parser("evaluate", help="Accuracy of a model on the labelled digits")
+    eval_parser.add_argument("store")
+    eval_parser.add_argument("--model", default="best_model.keras")
+    eval_parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None)
+    eval_parser.add_argument("--batch-size", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        store = ingest(args.store, args.sources, args.split, workers=args.workers)
+        print(json.dumps(store.info(), indent=2))
+    elif args.command == "info":
+        print(json.dumps(DigitStore(args.store).info(), indent=2))
+    else:
+        from backends import create_backend
+        accuracy, per_digit = evaluate(DigitStore(args.store), create_backend(args.backend, args.model),
+                                       args.batch_size)
+        print(f"Accuracy: {accuracy * 100:.2f}%")
+        print("Per digit: " + " ".join(f"{d}:{a * 100:.1f}%" for d, a in enumerate(per_digit)))
+
+
+if __name__ == "__main__":
+    main()
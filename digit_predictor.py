@@ -1,42 +1,71 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 import os
 import sys  # Import sys
+import argparse
+import threading
 import numpy as np
 import tkinter as tk
-import tensorflow as tf
-import matplotlib.pyplot as plt
 from datetime import datetime
-from tensorflow import keras
 from tkinter import messagebox, Scale, HORIZONTAL
 from PIL import Image, ImageDraw, ImageTk, ImageOps
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import webbrowser
 import ctypes # For Windows taskbar icon fix
+# TensorFlow and matplotlib are imported lazily (model loader thread / build_chart)
+# so the window can appear before the heavy libraries are loaded.
+from backends import create_backend
+from instrumentation import Instrumentation, MetricsExporter, current_rss_mb
+from live_predictor import LivePredictionWorker
+from model_registry import HotSwapBackend, ModelRegistry, RegistryWatcher
+from prediction_log import DEFAULT_LOG_DIR, KIND_BUTTON, KIND_LIVE, KIND_SEGMENT, PredictionLogWriter
+from prediction_cache import CachedBackend, PredictionCache
+from probability_chart import BACKGROUND_COLOR, ProbabilityChart
+from strokes import StrokeHistory
+from preprocessing import (CANVAS_SIZE, GUIDE_BOX_START_X, GUIDE_BOX_START_Y, GUIDE_BOX_END_X,
+                           GUIDE_BOX_END_Y, IncrementalRaster, to_model_input)
+
+_IMPORT_END = time.perf_counter()
 
 # --- Configuration ---
 # In a bundled app, Keras/TF will often find it if it's in the same directory.
 MODEL_PATH = "best_model.keras" # Change to relative path for bundled app
 
-CANVAS_SIZE = 280
-PREDICTION_IMAGE_SIZE = 28
 CONFIDENCE_THRESHOLD = 0.7
-BACKGROUND_COLOR = "#f0f0f0"
+LIVE_PREDICTION_DELAY_MS = 50  # Debounce between the last stroke event and a live prediction
+METRICS_SAMPLE_MS = 1000  # How often UI-side gauges (canvas items) and the debug panel refresh
 BUTTON_COLOR = "#4CAF50"
 CLEAR_COLOR = "#f44336"
 SAVE_COLOR = "#FF9800"
 ABOUT_COLOR = "#2196F3"
+UNDO_COLOR = "#607D8B"
+
+
+class StartupTimer:
+    """Time the startup phases (imports, window, chart, model load, first inference)."""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.phases = {}
 
-# Guide box parameters
-GUIDE_BOX_WIDTH = int(CANVAS_SIZE * 0.8)
-GUIDE_BOX_HEIGHT = int(CANVAS_SIZE * 0.8)
-GUIDE_BOX_START_X = (CANVAS_SIZE - GUIDE_BOX_WIDTH) // 2
-GUIDE_BOX_START_Y = (CANVAS_SIZE - GUIDE_BOX_HEIGHT) // 2
-GUIDE_BOX_END_X = GUIDE_BOX_START_X + GUIDE_BOX_WIDTH
-GUIDE_BOX_END_Y = GUIDE_BOX_START_Y + GUIDE_BOX_HEIGHT
+    def mark(self, phase, start):
+        self.phases[phase] = time.perf_counter() - start
+
+    def mark_since_origin(self, phase):
+        self.mark(phase, self.origin)
+
+    def report(self):
+        summary = " | ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items())
+        print(f"Startup timings: {summary}")
 
 
 class DigitPredictorApp:
-    def __init__(self, master):
+    def __init__(self, master, model_path=None, backend_name=None,
+                 metrics_file=None, metrics_port=None, debug=False, registry_path=None,
+                 tta=False, ensemble_paths=(), log_path=DEFAULT_LOG_DIR, center_digits=True):
         self.master = master
+        self.startup_timer = StartupTimer(_IMPORT_START)
+        self.startup_timer.phases["imports"] = _IMPORT_END - _IMPORT_START
         master.title("Advanced Digit Recognizer")
         master.geometry("1000x750")
         master.configure(bg=BACKGROUND_COLOR)
@@ -79,22 +108,53 @@ class DigitPredictorApp:
         master.attributes('-topmost', True)
         master.after_idle(master.attributes, '-topmost', False)
 
-        # Try to load the model
-        # Adjust MODEL_PATH here to reflect its location in the bundled app
-        # If your model is in C:\... during development, but bundled to the root,
-        # you need to ensure the bundled path is used.
+        # The model is loaded on a background thread once the window is up (see load_model_async)
         # For a bundled app, PyInstaller should put 'best_model.keras' in 'basedir'
-        bundled_model_path = os.path.join(basedir, "best_model.keras")
-        try:
-            self.model = keras.models.load_model(bundled_model_path)
-            print(f"Model loaded successfully from {bundled_model_path}")
-        except Exception as e:
-            messagebox.showerror("Model Loading Error", f"Failed to load model:\n{e}\n\nExpected model at: {bundled_model_path}")
-            self.model = None
+        self.model_path = model_path or os.path.join(basedir, MODEL_PATH)
+        self.backend_name = backend_name
+        self.backend = None
+        # With a model registry, new versions are loaded in the background and swapped in here
+        self.registry_path = registry_path
+        self.registry_watcher = None
+        self.model_failed = False  # "Model Error!" is on screen
+        self.model_slot = None
+        # Optional test-time augmentation / extra ensemble models, averaged in one batched call
+        self.tta = tta
+        self.confidence_threshold = CONFIDENCE_THRESHOLD  # Below it a prediction shows as "Unknown"
+        self.ensemble_paths = list(ensemble_paths)
+        self.ensemble_backends = []
+        self.model_backend = None  # The engine the cache wraps (plain, hot-swappable and/or TTA)
+        self.prediction_cache = None
+        self.displayed_key = None  # Cache key of the input whose prediction is on screen
+        self.prediction_worker = None
+        self.segment_worker = None
+
+        # Every prediction is appended to the log on a background thread; keys 0-9 correct it
+        self.prediction_log = None
+        if log_path:
+            try:
+                self.prediction_log = PredictionLogWriter(os.path.expanduser(log_path))
+            except OSError as e:
+                print(f"Warning: prediction log disabled ({e})")
+        self.model_version = None  # Recorded with each logged prediction
+        self.logged_tickets = []  # Log tickets of the prediction on screen (one per digit)
+        self.corrections_made = 0
+
+        # --- Instrumentation (timers around the hot paths; see show_debug_panel) ---
+        self.metrics = Instrumentation()
+        self.metrics.set_gauge("rss_mb", current_rss_mb)
+        self.metrics_exporter = None
+        if metrics_file or metrics_port is not None:
+            self.metrics_exporter = MetricsExporter(self.metrics, path=metrics_file, port=metrics_port)
+        self.debug_window = None
+        self.debug_label = None
 
         self.last_x, self.last_y = None, None
         self.drawing_line_width = 20
         self.drawing_out_of_bounds = False
+        self.live_prediction_job = None
+        # MNIST-style fit and center-of-mass centering of all ink, instead of the guide box as drawn
+        self.center_digits = center_digits
 
         # --- Header ---
         self.header = tk.Label(master, text="MNIST Digit Recognizer",
@@ -137,11 +197,17 @@ class DigitPredictorApp:
         # Initialize PIL Image
         self.image = Image.new("L", (CANVAS_SIZE, CANVAS_SIZE), "white")
         self.draw = ImageDraw.Draw(self.image)
+        # Tracks ink and the touched region so predicting only re-reads what changed
+        self.raster = IncrementalRaster()
+        # Point record of every stroke: one canvas item per finished stroke, undo/redo
+        self.strokes = StrokeHistory()
 
         # Bind mouse events
         self.canvas.bind("<Button-1>", self.start_draw)
         self.canvas.bind("<B1-Motion>", self.draw_line)
         self.canvas.bind("<ButtonRelease-1>", self.stop_draw)
+        master.bind("<Control-z>", lambda e: self.undo_stroke())
+        master.bind("<Control-y>", lambda e: self.redo_stroke())
 
         # --- Controls Frame ---
         self.controls_frame = tk.Frame(self.left_column, bg=BACKGROUND_COLOR)
@@ -163,6 +229,20 @@ class DigitPredictorApp:
                                                  font=("Helvetica", 10), bg=BACKGROUND_COLOR)
         self.current_thickness_label.pack(side=tk.LEFT)
 
+        # Live Prediction Toggle
+        self.live_prediction_var = tk.BooleanVar(value=False)
+        self.live_prediction_check = tk.Checkbutton(self.controls_frame, text="Predict as I draw",
+                                                    variable=self.live_prediction_var,
+                                                    font=("Helvetica", 10), bg=BACKGROUND_COLOR)
+        self.live_prediction_check.pack(side=tk.LEFT, padx=15)
+
+        # Multi-digit Toggle: classify every digit on the canvas, ignoring the guide box
+        self.multi_digit_var = tk.BooleanVar(value=False)
+        self.multi_digit_check = tk.Checkbutton(self.controls_frame, text="Multiple digits",
+                                                variable=self.multi_digit_var,
+                                                font=("Helvetica", 10), bg=BACKGROUND_COLOR)
+        self.multi_digit_check.pack(side=tk.LEFT)
+
         # Button Frame - Now centered
         self.button_frame = tk.Frame(self.left_column, bg=BACKGROUND_COLOR)
         self.button_frame.pack(pady=10)
@@ -171,11 +251,11 @@ class DigitPredictorApp:
         self.button_inner_frame = tk.Frame(self.button_frame, bg=BACKGROUND_COLOR)
         self.button_inner_frame.pack()
 
-        # Predict Button
-        self.predict_button = tk.Button(self.button_inner_frame, text="Predict Digit",
+        # Predict Button (disabled until the background model load finishes)
+        self.predict_button = tk.Button(self.button_inner_frame, text="Loading model...",
                                          command=self.predict_drawn_image,
                                          font=("Helvetica", 12), bg=BUTTON_COLOR, fg="white",
-                                         padx=15, pady=5)
+                                         padx=15, pady=5, state=tk.DISABLED)
         self.predict_button.pack(side=tk.LEFT, padx=5)
 
         # Clear Button
@@ -185,6 +265,13 @@ class DigitPredictorApp:
                                         padx=15, pady=5)
         self.clear_button.pack(side=tk.LEFT, padx=5)
 
+        # Undo Button (last stroke; Ctrl+Z / Ctrl+Y undo and redo)
+        self.undo_button = tk.Button(self.button_inner_frame, text="Undo",
+                                      command=self.undo_stroke,
+                                      font=("Helvetica", 12), bg=UNDO_COLOR, fg="white",
+                                      padx=15, pady=5)
+        self.undo_button.pack(side=tk.LEFT, padx=5)
+
         # Save Image Button
         self.save_button = tk.Button(self.button_inner_frame, text="Save Image",
                                       command=self.save_canvas_image,
@@ -199,6 +286,12 @@ class DigitPredictorApp:
                                        padx=15, pady=5)
         self.about_button.pack(side=tk.LEFT, padx=5)
 
+        # Status line (saves, corrections)
+        self.status_var = tk.StringVar()
+        self.status_label = tk.Label(self.left_column, textvariable=self.status_var,
+                                     font=("Helvetica", 9), fg="gray", bg=BACKGROUND_COLOR)
+        self.status_label.pack()
+
         # --- Right Column (Results) ---
         self.right_column = tk.Frame(self.main_frame, bg=BACKGROUND_COLOR)
         self.right_column.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=20, pady=10)
@@ -251,17 +344,148 @@ class DigitPredictorApp:
         self.chart_frame = tk.Frame(self.right_column, bg=BACKGROUND_COLOR)
         self.chart_frame.pack(fill=tk.BOTH, expand=True, pady=10)
 
-        self.figure = plt.Figure(figsize=(5, 4), dpi=100, facecolor=BACKGROUND_COLOR)
+        # The chart is built once the window has been drawn (see build_chart)
+        self.figure = None
+        self.ax = None
+        self.bar_chart = None
+        self.probability_chart = None
+
+        self.live_prediction_check.config(state=tk.DISABLED)
+        self.multi_digit_check.config(state=tk.DISABLED)
+        master.bind("<F12>", lambda e: self.show_debug_panel())
+        for digit in range(10):
+            master.bind(str(digit), lambda e, digit=digit: self.correct_prediction(digit))
+        master.protocol("WM_DELETE_WINDOW", self.on_close)
+        master.after_idle(self.on_window_ready)
+        master.after(METRICS_SAMPLE_MS, self.sample_ui_metrics)
+        if debug:
+            master.after_idle(self.show_debug_panel)
+
+    # --- Startup ---
+    def on_window_ready(self):
+        """Runs once the canvas is on screen: start the model load, then build the chart."""
+        self.startup_timer.mark_since_origin("window")
+        self.load_model_async()
+        self.build_chart()
+
+    def build_chart(self):
+        start = time.perf_counter()
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.figure = Figure(figsize=(5, 4), dpi=100, facecolor=BACKGROUND_COLOR)
         self.ax = self.figure.add_subplot(111)
         self.ax.set_facecolor(BACKGROUND_COLOR)
-        self.configure_chart_axes()
         self.bar_chart = FigureCanvasTkAgg(self.figure, self.chart_frame)
         self.bar_chart.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Bars and labels are persistent artists; predictions only blit their new values
+        self.probability_chart = ProbabilityChart(self.figure, self.ax, self.bar_chart)
+        self.startup_timer.mark("chart", start)
 
-        if self.model is None:
-            self.predict_button.config(state=tk.DISABLED)
-            self.prediction_var.set("Model Error!")
-            self.confidence_var.set("Failed to load model")
+    def load_model_async(self):
+        """Load and warm up the inference backend on a worker thread (TensorFlow is imported there)."""
+        post = lambda callback: self.master.after(0, callback)
+
+        def load():
+            try:
+                for path in self.ensemble_paths:
+                    ensemble_backend = create_backend(None, path)
+                    ensemble_backend.warmup()
+                    self.ensemble_backends.append(ensemble_backend)
+                if self.registry_path:
+                    self.registry_watcher = RegistryWatcher(
+                        ModelRegistry(self.registry_path), backend_name=self.backend_name,
+                        on_loaded=lambda backend, version, metadata: post(lambda: self.on_registry_model(backend, version)),
+                        on_error=lambda version, e: post(lambda: self.on_registry_error(version, e))).start()
+                    return
+
+                start = time.perf_counter()
+                backend = create_backend(self.backend_name, self.model_path)
+                self.startup_timer.mark("model_load", start)
+
+                start = time.perf_counter()
+                backend.warmup()
+                self.startup_timer.mark("first_inference", start)
+            except Exception as e:
+                self.master.after(0, lambda e=e: self.on_model_failed(e))
+                return
+            self.master.after(0, lambda: self.on_model_loaded(backend))
+
+        threading.Thread(target=load, name="model-loader", daemon=True).start()
+
+    def on_model_loaded(self, backend):
+        if self.tta or self.ensemble_backends:
+            from tta import DEFAULT_VARIANTS, TTA_CONFIDENCE_THRESHOLD, TTABackend  # Loads scipy.ndimage
+            variants = DEFAULT_VARIANTS if self.tta else (("identity",),)
+            if self.tta:
+                # Averaged variants are less peaked; this threshold is calibrated for them
+                self.confidence_threshold = TTA_CONFIDENCE_THRESHOLD
+            backend = TTABackend([backend] + self.ensemble_backends, variants)
+        self.model_backend = backend
+        if self.model_version is None:
+            self.model_version = os.path.basename(self.model_path)
+        # Repeated inputs (e.g. pressing Predict on an unchanged canvas) skip the model entirely
+        self.prediction_cache = PredictionCache(model_path=self.model_path)
+        self.backend = CachedBackend(backend, self.prediction_cache)
+        # Inference runs off the UI thread; results come back through master.after
+        self.prediction_worker = LivePredictionWorker(
+            self.predict_with_key, lambda result: self.show_prediction(*result),
+            post=lambda callback: self.master.after(0, callback),
+            on_error=self.show_prediction_error)
+        # Multi-digit mode: segmentation and one batched predict for all digits, also off the UI thread
+        self.segment_worker = LivePredictionWorker(
+            self.metrics.timed("segmentation")(self.recognize_with_latency),
+            self.show_segments,
+            post=lambda callback: self.master.after(0, callback),
+            on_error=self.show_prediction_error)
+        self.predict_button.config(text="Predict Digit", state=tk.NORMAL)
+        if self.model_failed:  # An earlier error (e.g. unreadable registry) no longer applies
+            self.model_failed = False
+            self.prediction_var.set("Draw a digit!")
+            self.confidence_var.set("Confidence: N/A")
+        self.live_prediction_check.config(state=tk.NORMAL)
+        self.multi_digit_check.config(state=tk.NORMAL)
+        print(f"Model loaded successfully from {self.model_path} ({self.backend.name} backend)")
+        self.startup_timer.mark_since_origin("ready")
+        self.startup_timer.report()
+        for phase, seconds in self.startup_timer.phases.items():
+            self.metrics.set_gauge(f"startup_{phase}_seconds", seconds)
+        for stat in ("entries", "hits", "misses", "hit_rate"):
+            self.metrics.set_gauge(f"cache_{stat}", lambda stat=stat: self.prediction_cache.stats()[stat])
+
+    def on_registry_model(self, backend, version):
+        """A validated registry version is ready: start with it, or swap it in for the current one."""
+        self.model_path = self.registry_watcher.registry.model_path(version)
+        self.model_version = version
+        self.master.title(f"Advanced Digit Recognizer ({version})")
+        if self.model_slot is None:
+            self.model_slot = HotSwapBackend(backend, version)
+            self.on_model_loaded(self.model_slot)
+            return
+        self.model_slot.swap(backend, version)
+        # Fresh cache so no prediction of the previous version is shown again
+        self.prediction_cache = PredictionCache(model_path=self.model_path)
+        self.backend = CachedBackend(self.model_backend, self.prediction_cache)
+        self.displayed_key = None
+        self.metrics.inc("model_swaps")
+        print(f"Switched to model {version} ({self.model_path})")
+
+    def on_registry_error(self, version, e):
+        if version is None and self.model_slot is None:
+            # Nothing could be served at all; shown once, cleared if a version loads later
+            if not self.model_failed:
+                self.on_model_failed(e)
+        else:
+            # Keep serving the current model (or the fallback the watcher tries next); a bad
+            # upload must not take the kiosk down
+            print(f"Model {version or '(registry)'} not activated: {e}")
+
+    def on_model_failed(self, e):
+        self.model_failed = True
+        self.predict_button.config(text="Predict Digit", state=tk.DISABLED)
+        self.prediction_var.set("Model Error!")
+        self.confidence_var.set("Failed to load model")
+        messagebox.showerror("Model Loading Error", f"Failed to load model:\n{e}\n\nExpected model at: {self.model_path}")
 
     def show_about(self):
         """Show smooth, centered About dialog with properly sized button"""
@@ -353,30 +577,102 @@ class DigitPredictorApp:
     # --- Drawing Functions ---
     def start_draw(self, event):
         self.last_x, self.last_y = event.x, event.y
+        self.strokes.begin(self.drawing_line_width, event.x, event.y)
         self.check_bounds(event.x, event.y)
 
     def draw_line(self, event):
+        with self.metrics.timer("draw_event"):
+            self._draw_line(event)
+
+    def _draw_line(self, event):
         if self.last_x and self.last_y:
+            # Temporary per-segment feedback; replaced by one polyline in stop_draw
             self.canvas.create_line(self.last_x, self.last_y, event.x, event.y,
                                      width=self.drawing_line_width, fill="black",
                                      capstyle=tk.ROUND, smooth=tk.TRUE,
-                                     tags="drawing_stroke")
+                                     tags=("drawing_stroke", "stroke_preview"))
             self.draw.line([self.last_x, self.last_y, event.x, event.y],
                             fill="black", width=self.drawing_line_width,
                             joint="round")
+            self.raster.mark_line(self.last_x, self.last_y, event.x, event.y, self.drawing_line_width)
+            if self.strokes.current is not None:
+                self.strokes.current.add(event.x, event.y)
+            self.metrics.inc("stroke_segments")
             self.last_x, self.last_y = event.x, event.y
             self.check_bounds(event.x, event.y)
+            if self.live_prediction_var.get():
+                self.schedule_live_prediction()
 
     def stop_draw(self, event):
         self.last_x, self.last_y = None, None
+        self.canvas.delete("stroke_preview")
+        # Box of the raw segments drawn while dragging, before simplification moves the points
+        released_box = self.strokes.current.bbox() if self.strokes.current is not None else None
+        stroke = self.strokes.end()
+        if stroke is not None:
+            self.create_stroke_item(stroke)
+            # Redraw just that box from the simplified strokes so the raster matches the canvas exactly
+            self.strokes.render_region(self.image, released_box)
+            self.raster.mark_dirty(*released_box)
+            self.metrics.inc("strokes")
+        if self.live_prediction_var.get():
+            self.schedule_live_prediction()
+
+    def create_stroke_item(self, stroke):
+        stroke.item = self.canvas.create_line(*stroke.flat(), width=stroke.width, fill="black",
+                                              capstyle=tk.ROUND, joinstyle=tk.ROUND,
+                                              tags="drawing_stroke")
+        self.canvas.tag_raise("guide_text")
+
+    def rerender_strokes(self, changed_box):
+        """Rebuild the PIL image from the stroke record; only `changed_box` is re-read for the model."""
+        self.image = self.strokes.render()
+        self.draw = ImageDraw.Draw(self.image)
+        self.raster.mark_dirty(*changed_box)
+        self.raster.has_ink = len(self.strokes) > 0
+
+    def undo_stroke(self):
+        if self.strokes.current is not None:
+            return  # Mid-stroke
+        stroke = self.strokes.undo()
+        if stroke is None:
+            return
+        self.canvas.delete(stroke.item)
+        self.rerender_strokes(stroke.bbox())
+        self.after_stroke_history_change()
+
+    def redo_stroke(self):
+        if self.strokes.current is not None:
+            return
+        stroke = self.strokes.redo()
+        if stroke is None:
+            return
+        self.create_stroke_item(stroke)
+        stroke.draw(self.draw)
+        self.raster.mark_dirty(*stroke.bbox())
+        self.raster.has_ink = True
+        self.after_stroke_history_change()
+
+    def after_stroke_history_change(self):
+        self.cancel_pending_predictions()
+        self.canvas.delete("segment_box")
+        self.drawing_out_of_bounds = False
+        self.canvas.itemconfig(self.guide_rect_id, outline="green")
+        for stroke in self.strokes:
+            for x, y in stroke.points:
+                self.check_bounds(x, y, stroke.width)
+        if not self.raster.has_ink:
+            self.reset_prediction_display()
+        elif self.live_prediction_var.get():
+            self.schedule_live_prediction()
 
     def update_thickness(self, value):
         self.drawing_line_width = int(value)
         self.current_thickness_label.config(text=str(self.drawing_line_width))
 
-    def check_bounds(self, x, y):
+    def check_bounds(self, x, y, width=None):
         min_x, min_y, max_x, max_y = self.guide_coords
-        half_brush = self.drawing_line_width / 2
+        half_brush = (width or self.drawing_line_width) / 2
         is_out = not (min_x + half_brush <= x <= max_x - half_brush and
                       min_y + half_brush <= y <= max_y - half_brush)
         if is_out and not self.drawing_out_of_bounds:
@@ -384,91 +680,201 @@ class DigitPredictorApp:
             self.canvas.itemconfig(self.guide_rect_id, outline="red")
 
     def clear_canvas(self):
+        self.cancel_pending_predictions()
         self.canvas.delete("drawing_stroke")
+        self.metrics.inc("canvas_clears")
+        self.canvas.delete("segment_box")
         self.image = Image.new("L", (CANVAS_SIZE, CANVAS_SIZE), "white")
         self.draw = ImageDraw.Draw(self.image)
+        self.raster.reset()
+        self.strokes.clear()
+        self.reset_prediction_display()
+        self.drawing_out_of_bounds = False
+        self.canvas.itemconfig(self.guide_rect_id, outline="green")
+        self.canvas.tag_raise("guide_text")
+
+    def reset_prediction_display(self):
+        self.displayed_key = None
+        self.logged_tickets = []
+        self.status_var.set("")
         self.prediction_var.set("Draw a digit!")
         self.confidence_var.set("Confidence: N/A")
         self.meter_canvas.coords(self.meter, 0, 0, 0, 20)
-        self.ax.clear()
-        self.configure_chart_axes()
-        self.bar_chart.draw()
+        if self.probability_chart is not None:
+            self.probability_chart.clear()
         self.clear_captured_image()
-        self.drawing_out_of_bounds = False
-        self.canvas.itemconfig(self.guide_rect_id, outline="green")
-        self.canvas.tag_raise("guide_text")
 
     def clear_captured_image(self):
         self.capture_canvas.delete("all")
         self.capture_canvas.create_rectangle(0, 0, 120, 120, fill="white", outline="gray")
 
     def save_canvas_image(self):
-        try:
-            # Use os.path.join for cross-platform compatibility
-            output_dir = os.path.join(os.path.expanduser("~"), "saved_digits") # Save to user's home directory
-            os.makedirs(output_dir, exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(output_dir, f"digit_{timestamp}.png")
-            self.image.save(filename)
-            messagebox.showinfo("Image Saved", f"Digit image saved as:\n{filename}")
-        except Exception as e:
-            messagebox.showerror("Save Error", f"Failed to save image:\n{e}")
-
-    def configure_chart_axes(self):
-        self.ax.set_ylim(0, 1)
-        self.ax.set_xlim(-0.5, 9.5)
-        self.ax.set_xticks(range(10))
-        self.ax.set_xlabel('Digits (0-9)', fontsize=9)
-        self.ax.set_ylabel('Probability', fontsize=9)
-        self.ax.set_title('Digit Probability Distribution', fontsize=11, pad=10)
-        self.ax.grid(True, linestyle='--', alpha=0.6)
+        """Write the canvas as a PNG on a background thread; the result is shown in the status line."""
+        image = self.image.copy()
+        # Use os.path.join for cross-platform compatibility
+        output_dir = os.path.join(os.path.expanduser("~"), "saved_digits") # Save to user's home directory
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = os.path.join(output_dir, f"digit_{timestamp}.png")
+
+        def save():
+            try:
+                os.makedirs(output_dir, exist_ok=True)
+                image.save(filename)
+                message = f"Saved {filename}"
+            except Exception as e:
+                message = f"Failed to save image: {e}"
+            self.master.after(0, lambda: self.status_var.set(message))
+
+        threading.Thread(target=save, name="save-image", daemon=True).start()
+
+    def correct_prediction(self, digit):
+        """Record the digit the user meant for the prediction on screen (left to right for several)."""
+        if self.prediction_log is None or not self.logged_tickets:
+            return
+        position = min(self.corrections_made, len(self.logged_tickets) - 1)
+        self.prediction_log.correct(self.logged_tickets[position], digit)
+        self.corrections_made += 1
+        self.metrics.inc("corrections")
+        which = f" (digit {position + 1})" if len(self.logged_tickets) > 1 else ""
+        self.status_var.set(f"Corrected to {digit}{which}; saved to the prediction log")
+
+    def log_predictions(self, img_arrays, probabilities, latency_ms, kind):
+        """Queue the predictions now on screen for the log; digit keys then correct them."""
+        self.corrections_made = 0
+        self.logged_tickets = []
+        if self.prediction_log is None:
+            return
+        self.logged_tickets = [self.prediction_log.record(img_array, probs, self.model_version, latency_ms, kind)
+                            for img_array, probs in zip(img_arrays, probabilities)]
+        self.status_var.set("Wrong? Type the correct digit" + ("s" if len(self.logged_tickets) > 1 else ""))
 
     def preprocess_drawn_image(self):
         # Check for empty canvas
-        if np.all(np.array(self.image) == 255):
+        if not self.raster.has_ink:
             messagebox.showwarning("Empty Canvas", "Please draw a digit first")
             return None
 
-        crop_region = (GUIDE_BOX_START_X, GUIDE_BOX_START_Y, GUIDE_BOX_END_X, GUIDE_BOX_END_Y)
-        img_cropped = self.image.crop(crop_region)
-        img_resized = img_cropped.resize((PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE),
-                                         Image.Resampling.LANCZOS)
-        img_array = 255 - np.array(img_resized)
+        with self.metrics.timer("preprocess"):
+            img_array = self.current_model_image()
         self.display_processed_image(img_array)
-        img_normalized = img_array.astype("float32") / 255.0
 
-        return img_normalized.reshape(1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1)
+        return img_array
+
+    def current_model_image(self):
+        """The 28x28 uint8 model input for the canvas as it is now."""
+        if self.center_digits:
+            return self.raster.normalized(self.image)
+        return self.raster.update(self.image)
 
     def display_processed_image(self, img_array):
         img = Image.fromarray(img_array)
-        img_display = img.resize((100, 100), Image.Resampling.NEAREST)
+        # Several digits side by side (multi-digit mode) are shrunk to the same 100px width
+        height = max(1, round(100 * img.height / img.width))
+        img_display = img.resize((100, height), Image.Resampling.NEAREST)
         self.capture_img = ImageTk.PhotoImage(image=img_display)
         self.capture_canvas.delete("all")
         self.capture_canvas.create_image(60, 60, image=self.capture_img)
 
+    # --- Live Prediction ---
+    def schedule_live_prediction(self):
+        """Debounce drawing events: only the last one in a burst triggers a prediction."""
+        if self.live_prediction_job is not None:
+            self.master.after_cancel(self.live_prediction_job)
+        self.live_prediction_job = self.master.after(LIVE_PREDICTION_DELAY_MS, self.run_live_prediction)
+
+    def run_live_prediction(self):
+        self.live_prediction_job = None
+        if self.prediction_worker is None or not self.raster.has_ink:
+            return
+        if self.multi_digit_var.get():
+            self.segment_worker.submit(self.image.copy())
+            return
+        with self.metrics.timer("preprocess"):
+            img_array = self.current_model_image()
+        self.display_processed_image(img_array)
+        self.request_prediction(img_array, KIND_LIVE)
+
+    def cancel_pending_predictions(self):
+        if self.live_prediction_job is not None:
+            self.master.after_cancel(self.live_prediction_job)
+            self.live_prediction_job = None
+        if self.prediction_worker is not None:
+            self.prediction_worker.cancel()
+            self.segment_worker.cancel()
+
     def predict_drawn_image(self):
-        if self.model is None:
+        if self.backend is None:
             messagebox.showwarning("No Model", "Model is not loaded. Cannot make predictions.")
             return
 
-        if self.drawing_out_of_bounds:
+        if self.multi_digit_var.get():
+            if not self.raster.has_ink:
+                messagebox.showwarning("Empty Canvas", "Please draw a digit first")
+                return
+            # The whole canvas is segmented, so the guide box does not apply
+            self.segment_worker.submit(self.image.copy())
+            return
+
+        if self.drawing_out_of_bounds and not self.center_digits:
             if not messagebox.askyesno(
                 "Drawing Out of Bounds",
                 "Your drawing extends beyond the guide area.\nProceed with prediction anyway?"
             ):
                 return
 
-        processed_image = self.preprocess_drawn_image()
-        if processed_image is None:
+        img_array = self.preprocess_drawn_image()
+        if img_array is None:
             return
 
+        self.request_prediction(img_array, KIND_BUTTON)
+
+    def request_prediction(self, img_array, kind):
+        """Answer from the cache on the UI thread if possible, otherwise queue for the worker."""
+        self.metrics.inc("predictions")
+        model_input = to_model_input(img_array)
+        key = self.prediction_cache.key(model_input)
+        cached = self.prediction_cache.get(model_input, key)
+        if cached is None:
+            self.prediction_worker.submit((img_array, kind))
+            return
+        self.prediction_worker.cancel()  # An older in-flight request must not overwrite this
+        if key != self.displayed_key:
+            self.show_prediction(key, cached, img_array, 0.0, kind)
+
+    def predict_with_key(self, request):
+        """Worker-thread predict; the key lets the UI recognise an unchanged canvas later.
+
+        `request_prediction` already missed the cache for this input, so the model is called
+        directly and the answer stored, without a second lookup (and a second counted miss).
+        """
+        img_array, kind = request
+        cache = self.prediction_cache  # A model swap meanwhile replaces the cache; fill the old one
+        model_input = to_model_input(img_array)
+        key = cache.key(model_input)
+        start = time.perf_counter()
+        with self.metrics.timer("model_predict"):
+            probabilities = self.model_backend.predict(model_input)[0]
+        latency_ms = (time.perf_counter() - start) * 1000
+        return key, cache.put(model_input, probabilities, key), img_array, latency_ms, kind
+
+    def recognize_with_latency(self, image):
+        """Worker-thread multi-digit recognition, timed for the prediction log."""
+        from segmentation import recognize_digits  # Loads scipy.ndimage, so not before the window is up
+        start = time.perf_counter()
+        segments = recognize_digits(self.backend, image)
+        return segments, (time.perf_counter() - start) * 1000
+
+    def show_prediction(self, key, probabilities, img_array=None, latency_ms=0.0, kind=KIND_BUTTON):
+        """Display a probability vector; always called on the UI thread."""
+        self.displayed_key = key
+        if img_array is not None:
+            self.log_predictions([img_array], [probabilities], latency_ms, kind)
         try:
-            predictions = self.model.predict(processed_image, verbose=0)
-            predicted_digit = np.argmax(predictions[0])
-            confidence = np.max(predictions[0])
+            predicted_digit = np.argmax(probabilities)
+            confidence = np.max(probabilities)
 
             # Update UI
-            if confidence < CONFIDENCE_THRESHOLD:
+            if confidence < self.confidence_threshold:
                 self.prediction_var.set("Unknown")
                 self.prediction_label.config(fg="red")
             else:
@@ -479,26 +885,123 @@ class DigitPredictorApp:
             self.meter_canvas.coords(self.meter, 0, 0, 200 * confidence, 20)
 
             # Update chart
-            self.ax.clear()
-            bars = self.ax.bar(range(10), predictions[0], color='#4CAF50')
-            bars[predicted_digit].set_color('#2196F3')
-            for i, v in enumerate(predictions[0]):
-                self.ax.text(i, v + 0.02, f"{v:.2f}", color='black', ha='center', fontsize=8)
-            self.configure_chart_axes()
-            self.bar_chart.draw()
+            with self.metrics.timer("chart_update"):
+                self.probability_chart.update(probabilities)
 
         except Exception as e:
-            error_msg = f"Prediction Error:\n\n{str(e)}"
-            if self.model is not None and hasattr(self.model, 'input_shape'):
-                error_msg += f"\n\nExpected shape: {self.model.input_shape}"
-                if 'processed_image' in locals():
-                    error_msg += f"\nActual shape: {processed_image.shape}"
-            messagebox.showerror("Prediction Error", error_msg)
-            self.prediction_var.set("Error!")
-            self.confidence_var.set("See error message")
+            self.show_prediction_error(e)
+
+    def show_segments(self, result):
+        """Display the digits found in multi-digit mode, left to right."""
+        segments, latency_ms = result
+        self.displayed_key = None
+        self.canvas.delete("segment_box")
+        if not segments:
+            self.prediction_var.set("No digits")
             self.prediction_label.config(fg="red")
+            return
+        # The batched call's time is shared between its digits
+        self.log_predictions([s.img_array for s in segments], [s.probabilities for s in segments],
+                             latency_ms / len(segments), KIND_SEGMENT)
+
+        for segment in segments:
+            self.canvas.create_rectangle(*segment.box, outline=ABOUT_COLOR, width=1, tags="segment_box")
+        self.prediction_var.set("".join(str(s.digit) if s.confidence >= self.confidence_threshold else "?"
+                                        for s in segments))
+        self.prediction_label.config(fg=BUTTON_COLOR)
+
+        # The least certain digit is the one worth a second look: show its confidence and chart
+        weakest = min(segments, key=lambda s: s.confidence)
+        self.confidence_var.set(f"Lowest confidence: {weakest.confidence * 100:.1f}%")
+        self.meter_canvas.coords(self.meter, 0, 0, 200 * weakest.confidence, 20)
+        self.display_processed_image(np.hstack([s.img_array for s in segments]))
+        if self.probability_chart is not None:
+            with self.metrics.timer("chart_update"):
+                self.probability_chart.update(weakest.probabilities)
+
+    def show_prediction_error(self, e):
+        self.metrics.inc("prediction_errors")
+        self.cancel_pending_predictions()
+        error_msg = f"Prediction Error:\n\n{str(e)}"
+        if self.backend is not None:
+            error_msg += f"\n\nBackend: {self.backend.name} ({self.model_path})"
+        if not self.live_prediction_var.get():
+            messagebox.showerror("Prediction Error", error_msg)
+        else:
+            print(error_msg)
+        self.prediction_var.set("Error!")
+        self.confidence_var.set("See error message")
+        self.prediction_label.config(fg="red")
+
+    # --- Instrumentation ---
+    def sample_ui_metrics(self):
+        """Sample gauges that need Tk (UI thread only) and refresh the debug panel."""
+        self.metrics.set_gauge("canvas_items", len(self.canvas.find_all()))
+        self.metrics.set_gauge("canvas_stroke_items", len(self.canvas.find_withtag("drawing_stroke")))
+        if self.debug_window is not None:
+            self.debug_label.config(text=self.format_debug_text())
+        self.master.after(METRICS_SAMPLE_MS, self.sample_ui_metrics)
+
+    def format_debug_text(self):
+        snapshot = self.metrics.snapshot()
+        lines = [f"Uptime: {snapshot['uptime_s']:.0f} s", "", "Timers (recent window):"]
+        for name, summary in sorted(snapshot["timers"].items()):
+            lines.append(f"  {name:<15} p50 {summary['p50_ms']:7.2f} ms  p99 {summary['p99_ms']:7.2f} ms"
+                         f"  max {summary['max_ms']:7.1f} ms  n={summary['total_count']}")
+        lines += ["", "Gauges:"]
+        lines += [f"  {name:<28} {value:,.3f}" for name, value in sorted(snapshot["gauges"].items())]
+        lines += ["", "Counters:"]
+        lines += [f"  {name:<28} {value:,}" for name, value in sorted(snapshot["counters"].items())]
+        return "\n".join(lines)
+
+    def show_debug_panel(self):
+        """Toggle a window with live timings, memory and counters (F12)."""
+        if self.debug_window is not None:
+            self.debug_window.destroy()
+            self.debug_window = None
+            return
+        self.debug_window = tk.Toplevel(self.master)
+        self.debug_window.title("Diagnostics")
+        self.debug_window.protocol("WM_DELETE_WINDOW", self.show_debug_panel)
+        self.debug_label = tk.Label(self.debug_window, text=self.format_debug_text(), justify=tk.LEFT,
+                                    anchor="nw", font=("Courier", 9), padx=10, pady=10)
+        self.debug_label.pack(fill=tk.BOTH, expand=True)
+
+    def on_close(self):
+        if self.registry_watcher is not None:
+            self.registry_watcher.stop()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()  # Final write so the file reflects the whole session
+        if self.prediction_log is not None:
+            self.prediction_log.close()  # Flush predictions and corrections still queued
+        self.master.destroy()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MNIST digit recognizer")
+    parser.add_argument("--model", default=None, help="Model file (.keras, .tflite or .npz weights)")
+    parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None,
+                        help="Inference engine (default: chosen from the model file extension)")
+    parser.add_argument("--debug", action="store_true", help="Open the diagnostics panel (toggle with F12)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Periodically write metrics here (.json, otherwise Prometheus text)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--registry", default=None,
+                        help="Model registry directory; new versions are hot-swapped without a restart")
+    parser.add_argument("--tta", action="store_true",
+                        help="Average predictions over shifted/scaled/thickened variants (one batched call)")
+    parser.add_argument("--ensemble", nargs="+", default=[], metavar="MODEL",
+                        help="Extra model files whose predictions are averaged with the main model")
+    parser.add_argument("--log", default=DEFAULT_LOG_DIR,
+                        help="Prediction log directory (query it with prediction_log.py)")
+    parser.add_argument("--no-log", action="store_true", help="Do not record predictions")
+    parser.add_argument("--no-center", action="store_true",
+                        help="Downscale the guide box as drawn instead of fitting and centering the digit like MNIST")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = DigitPredictorApp(root)
+    app = DigitPredictorApp(root, model_path=args.model, backend_name=args.backend,
+                            metrics_file=args.metrics_file, metrics_port=args.metrics_port, debug=args.debug,
+                            registry_path=args.registry, tta=args.tta, ensemble_paths=args.ensemble,
+                            log_path=None if args.no_log else args.log, center_digits=not args.no_center)
     root.mainloop()
\ No newline at end of file
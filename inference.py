@@ -0,0 +1,322 @@
+"""Headless digit inference: classify folders, globs or NumPy stacks of digits without the Tk app.
+
+Usage:
+    python inference.py ~/saved_digits --batch-size 1024 --workers 8 --output results.csv
+"""
+import os
+import sys
+import csv
+import glob
+import time
+import argparse
+from collections import deque
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from preprocessing import CANVAS_SIZE, PREDICTION_IMAGE_SIZE, mnist_normalize, preprocess_image, to_model_input
+
+MODEL_PATH = "best_model.keras"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+DEFAULT_BATCH_SIZE = 1024
+
+
+def resource_path(filename):
+    """Locate a bundled resource, both when run from source and from a PyInstaller executable."""
+    if getattr(sys, 'frozen', False) and hasattr(sys, '_MEIPASS'):
+        basedir = sys._MEIPASS
+    else:
+        basedir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(basedir, filename)
+
+
+def load_digit_model(model_path=None):
+    """Load the Keras digit classifier (defaults to the bundled best_model.keras)."""
+    from tensorflow import keras  # Heavy import, only paid when a model is actually needed
+    return keras.models.load_model(model_path or resource_path(MODEL_PATH))
+
+
+def iter_image_paths(sources):
+    """Expand files, directories and glob patterns into a sorted list of image/.npy paths."""
+    paths = []
+    for source in sources:
+        source = os.path.expanduser(source)
+        if os.path.isdir(source):
+            matches = [os.path.join(source, name) for name in os.listdir(source)]
+        elif os.path.isfile(source):
+            matches = [source]
+        else:
+            matches = glob.glob(source, recursive=True)
+        paths.extend(path for path in sorted(matches)
+                     if path.lower().endswith(IMAGE_EXTENSIONS + (".npy",)))
+    return paths
+
+
+def stack_to_mnist(images):
+    """Convert a NumPy stack of digits into (N, 28, 28) uint8 MNIST-style arrays.
+
+    28x28 stacks are taken as already MNIST-style (white ink on black, 0-255 or 0-1),
+    280x280 stacks as raw canvases (black ink on white) and go through the canvas pipeline.
+    """
+    images = np.asarray(images)
+    if images.ndim == 4 and images.shape[-1] == 1:
+        images = images[..., 0]
+    if images.ndim == 2:
+        images = images[np.newaxis]
+    if images.ndim != 3:
+        raise ValueError(f"Expected an (N, H, W) stack of digits, got shape {images.shape}")
+
+    if np.issubdtype(images.dtype, np.floating) and images.max(initial=0) <= 1.0:
+        images = images * 255.0
+    images = np.clip(images, 0, 255).astype(np.uint8)
+
+    if images.shape[1:] == (PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE):
+        return images
+    if images.shape[1:] == (CANVAS_SIZE, CANVAS_SIZE):
+        return mnist_normalize(255 - images)  # preprocess_image for the whole stack in one pass
+    raise ValueError(f"Unsupported digit size {images.shape[1:]}; expected 28x28 or {CANVAS_SIZE}x{CANVAS_SIZE}")
+
+
+def load_digit_file(path):
+    """Load one image (or .npy stack) from disk as (N, 28, 28) uint8 arrays."""
+    if path.lower().endswith(".npy"):
+        return stack_to_mnist(np.load(path))
+    with Image.open(path) as img:
+        return preprocess_image(img)[np.newaxis]
+
+
+def _load_or_error(path):
+    try:
+        return load_digit_file(path), None
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def load_digits(sources, workers=None):
+    """Decode and preprocess sources in parallel.
+
+    `sources` may be a NumPy stack or a list mixing paths, directories, globs and arrays.
+    Returns (names, uint8 array of shape (N, 28, 28), failed) where `failed` lists the
+    (path, error) of files that could not be read; they are skipped, not fatal.
+    """
+    if isinstance(sources, np.ndarray):
+        images = stack_to_mnist(sources)
+        return [f"array[{i}]" for i in range(len(images))], images, []
+    if isinstance(sources, str):
+        sources = [sources]
+
+    # Arrays are converted in place; every file of every source is decoded by one pool
+    entries = []  # (name, is_array, (stack, error) or None until decoded)
+    for index, source in enumerate(sources):
+        if isinstance(source, np.ndarray):
+            entries.append((f"array{index}", True, (stack_to_mnist(source), None)))
+        else:
+            entries.extend((path, False, None) for path in iter_image_paths([source]))
+    paths = [name for name, is_array, _ in entries if not is_array]
+    if paths:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            decoded = iter(pool.map(_load_or_error, paths))
+            entries = [(name, is_array, loaded if is_array else next(decoded))
+                       for name, is_array, loaded in entries]
+
+    names, chunks, failed = [], [], []
+    for name, is_array, (stack, error) in entries:
+        if error is not None:
+            failed.append((name, error))
+            continue
+        if len(stack) == 1 and not is_array:
+            names.append(name)
+        else:
+            names.extend(f"{name}[{i}]" for i in range(len(stack)))
+        chunks.append(stack)
+
+    if not chunks:
+        return [], np.empty((0, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE), dtype=np.uint8), failed
+    return names, np.concatenate(chunks), failed
+
+
+class BatchResult:
+    """Predictions for a batch run plus timing information."""
+
+    def __init__(self, names, probabilities, load_seconds, predict_seconds, failed=()):
+        self.names = names
+        self.failed = list(failed)  # (path, error) of files skipped because they could not be read
+        self.probabilities = probabilities
+        self.predictions = np.argmax(probabilities, axis=1) if len(probabilities) else np.empty(0, dtype=int)
+        self.confidences = np.max(probabilities, axis=1) if len(probabilities) else np.empty(0)
+        self.load_seconds = load_seconds
+        self.predict_seconds = predict_seconds
+
+    @property
+    def total_seconds(self):
+        return self.load_seconds + self.predict_seconds
+
+    @property
+    def images_per_second(self):
+        return len(self.names) / self.total_seconds if self.total_seconds > 0 else float("inf")
+
+    @property
+    def predict_images_per_second(self):
+        return len(self.names) / self.predict_seconds if self.predict_seconds > 0 else float("inf")
+
+    def summary(self):
+        skipped = f" ({len(self.failed)} unreadable files skipped)" if self.failed else ""
+        return (f"{len(self.names)} images{skipped} | load {self.load_seconds:.2f}s | "
+                f"predict {self.predict_seconds:.2f}s ({self.predict_images_per_second:,.0f} img/s) | "
+                f"total {self.images_per_second:,.0f} img/s")
+
+
+class BatchInferenceEngine:
+    """Classify large collections of digits with vectorized, batched model calls."""
+
+    def __init__(self, backend=None, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+        from backends import InferenceBackend, KerasBackend
+        # Anything that is not a backend (None, a path or a Keras model) goes through Keras
+        self.backend = backend if isinstance(backend, InferenceBackend) else KerasBackend(backend)
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+
+    def load(self, sources):
+        """Decode and preprocess sources in parallel; see `load_digits`."""
+        return load_digits(sources, self.workers)
+
+    def predict(self, images):
+        """Return the (N, 10) probability matrix for a (N, 28, 28) uint8 stack."""
+        if len(images) == 0:
+            return np.empty((0, 10), dtype=np.float32)
+        probabilities = []
+        # Normalize per batch so only one float32 batch is alive at a time
+        for start in range(0, len(images), self.batch_size):
+            batch = to_model_input(images[start:start + self.batch_size])
+            probabilities.append(self.backend.predict(batch))
+        return np.concatenate(probabilities)
+
+    def classify(self, sources):
+        """Load, preprocess and classify `sources`, returning a BatchResult."""
+        start = time.perf_counter()
+        names, images, failed = self.load(sources)
+        loaded = time.perf_counter()
+        probabilities = self.predict(images)
+        done = time.perf_counter()
+        return BatchResult(names, probabilities, loaded - start, done - loaded, failed)
+
+
+class LatencyTracker:
+    """Rolling window of per-call latencies with percentile reporting (milliseconds)."""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds * 1000.0)
+
+    def percentile(self, q):
+        if not self.samples:
+            return float("nan")
+        return float(np.percentile(np.fromiter(self.samples, dtype=np.float64), q))
+
+    def summary(self):
+        return {"count": len(self.samples), "p50_ms": self.percentile(50), "p99_ms": self.percentile(99)}
+
+
+class FastPredictor:
+    """Low-latency single-digit predictor.
+
+    `model.predict` builds a data adapter, step function and callbacks on every call, which
+    dominates the cost of a single 1x28x28x1 input. This wraps the model in a `tf.function`
+    traced once for a fixed input signature and warms it up, so each call is one graph run.
+    """
+
+    def __init__(self, model, warmup_runs=3, latency_window=1000):
+        import tensorflow as tf
+        self.model = model
+        self.latency = LatencyTracker(latency_window)
+        self._forward = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec([1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1], tf.float32)],
+            reduce_retracing=True,
+        )
+        self.warmup(warmup_runs)
+
+    def warmup(self, runs=3):
+        """Trace the graph and run it a few times so the first user click is already fast."""
+        blank = np.zeros((1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1), dtype=np.float32)
+        for _ in range(max(runs, 1)):
+            self._forward(blank)
+
+    def predict(self, model_input):
+        """Return the (10,) probability vector for one (1, 28, 28, 1) float32 input."""
+        start = time.perf_counter()
+        probabilities = self._forward(np.asarray(model_input, dtype=np.float32)).numpy()[0]
+        self.latency.record(time.perf_counter() - start)
+        return probabilities
+
+
+def measure_latency(model, runs=200):
+    """Compare per-call latency of `model.predict` against the FastPredictor path."""
+    predictor = FastPredictor(model)
+    sample = np.random.default_rng(0).random((1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1),
+                                             dtype=np.float32)
+    baseline = LatencyTracker(runs)
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(sample, verbose=0)
+        baseline.record(time.perf_counter() - start)
+    for _ in range(runs):
+        predictor.predict(sample)
+    return {"model.predict": baseline.summary(), "fast_path": predictor.latency.summary()}
+
+
+def write_results_csv(result, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "prediction", "confidence"] + [f"p{i}" for i in range(10)])
+        for name, digit, confidence, probs in zip(result.names, result.predictions,
+                                                   result.confidences, result.probabilities):
+            writer.writerow([name, int(digit), f"{confidence:.4f}"] + [f"{p:.4f}" for p in probs])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify saved digit images in batches.")
+    parser.add_argument("sources", nargs="*", help="Image files, directories, glob patterns or .npy stacks")
+    parser.add_argument("--model", default=None, help="Path to the model (default: bundled best_model.keras)")
+    parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None,
+                        help="Inference engine (default: chosen from the model file extension)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Threads used to decode images (default: CPU count)")
+    parser.add_argument("--output", help="Write per-image predictions to this CSV file")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="Skip the model for repeated digits using an LRU cache of this many entries")
+    parser.add_argument("--latency-runs", type=int, default=0,
+                        help="Also report single-sample p50/p99 latency over this many calls")
+    args = parser.parse_args(argv)
+    if not args.sources and not args.latency_runs:
+        parser.error("give at least one source or --latency-runs")
+
+    from backends import create_backend
+    if args.latency_runs:
+        for name, stats in measure_latency(load_digit_model(args.model), args.latency_runs).items():
+            print(f"{name:>14}: p50 {stats['p50_ms']:.2f} ms | p99 {stats['p99_ms']:.2f} ms ({stats['count']} calls)")
+    if not args.sources:
+        return
+
+    model_path = args.model or resource_path(MODEL_PATH)
+    backend = create_backend(args.backend, model_path)
+    if args.cache_size:
+        from prediction_cache import CachedBackend, PredictionCache
+        backend = CachedBackend(backend, PredictionCache(args.cache_size, model_path=model_path))
+    engine = BatchInferenceEngine(backend, batch_size=args.batch_size,
+                                  workers=args.workers)
+    result = engine.classify(args.sources)
+    for path, error in result.failed:
+        print(f"Skipped {path}: {error}")
+    print(result.summary())
+    if args.cache_size:
+        print(f"Cache: {backend.cache.stats()}")
+    if args.output:
+        write_results_csv(result, args.output)
+        print(f"Predictions written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
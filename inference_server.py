@@ -0,0 +1,253 @@
+"""Local HTTP inference server with dynamic request batching.
+
+Endpoints:
+    POST /predict   body: a PNG/JPEG image (Content-Type image/*) or 784 raw bytes of a
+                    28x28 uint8 MNIST-style digit (Content-Type application/octet-stream)
+    GET  /metrics   queue depth, batch-size histogram and latency percentiles (JSON)
+    GET  /health    200 once the model is loaded (with the registry version, if any)
+
+Concurrent requests are grouped by DynamicBatcher into one vectorized predict call of up
+to --max-batch-size inputs, waiting at most --max-wait-ms for a batch to fill.
+
+Usage:
+    python inference_server.py --port 8500 --max-batch-size 64 --max-wait-ms 5
+    curl --data-binary @digit.png -H "Content-Type: image/png" http://127.0.0.1:8500/predict
+"""
+import io
+import json
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+
+from backends import create_backend
+from inference import LatencyTracker, MODEL_PATH, resource_path
+from model_registry import WATCH_INTERVAL_S, serve_from_registry
+from preprocessing import PREDICTION_IMAGE_SIZE, preprocess_image, to_model_input
+
+DEFAULT_PORT = 8500
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 5.0
+RAW_DIGIT_BYTES = PREDICTION_IMAGE_SIZE * PREDICTION_IMAGE_SIZE
+
+
+class DynamicBatcher:
+    """Group concurrent single-digit requests into batched backend calls.
+
+    A worker thread takes the first queued request, keeps collecting until `max_batch_size`
+    requests are in hand or `max_wait_ms` has passed, then runs one `backend.predict`.
+    """
+
+    def __init__(self, backend, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.request_latency = LatencyTracker()
+        self.queue_wait = LatencyTracker()
+        self.predict_latency = LatencyTracker()
+        self.requests = 0
+        self.errors = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, img_array):
+        """Queue one (28, 28) uint8 digit; returns a Future resolving to its (10,) probabilities."""
+        future = Future()
+        self._queue.put((img_array, future, time.perf_counter()))
+        return future
+
+    def predict(self, img_array, timeout=None):
+        return self.submit(img_array).result(timeout)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout=1.0)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+            images = np.stack([img_array for img_array, _, _ in batch])
+            start = time.perf_counter()
+            try:
+                probabilities = self.backend.predict(to_model_input(images))
+            except Exception as e:
+                with self._lock:
+                    self.errors += len(batch)
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            done = time.perf_counter()
+
+            with self._lock:
+                self.batch_sizes[len(batch)] += 1
+                self.requests += len(batch)
+                self.predict_latency.record(done - start)
+                for _, _, submitted in batch:
+                    self.queue_wait.record(start - submitted)
+                    self.request_latency.record(done - submitted)
+            for (_, future, _), probs in zip(batch, probabilities):
+                future.set_result(probs)
+
+    def metrics(self):
+        with self._lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "queue_depth": self.queue_depth,
+                "requests": self.requests,
+                "errors": self.errors,
+                "batches": batches,
+                "mean_batch_size": self.requests / batches if batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                "request_latency_ms": self._percentiles(self.request_latency),
+                "queue_wait_ms": self._percentiles(self.queue_wait),
+                "predict_latency_ms": self._percentiles(self.predict_latency),
+            }
+
+    @staticmethod
+    def _percentiles(tracker):
+        return {f"p{q}": tracker.percentile(q) for q in (50, 90, 99)}
+
+
+def decode_payload(body, content_type):
+    """Turn a request body into a (28, 28) uint8 MNIST-style digit."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type == "application/octet-stream" or (not content_type.startswith("image/")
+                                                       and len(body) == RAW_DIGIT_BYTES):
+        if len(body) != RAW_DIGIT_BYTES:
+            raise ValueError(f"Raw payloads must be exactly {RAW_DIGIT_BYTES} bytes (28x28 uint8)")
+        return np.frombuffer(body, dtype=np.uint8).reshape(PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE)
+    with Image.open(io.BytesIO(body)) as img:
+        return preprocess_image(img)
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    server_version = "DigitInferenceServer/1.0"
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(200, self.server.batcher.metrics())
+        elif self.path == "/health":
+            backend = self.server.batcher.backend
+            self._send_json(200, {"status": "ok", "backend": backend.name,
+                                  "model_version": getattr(backend, "version", None)})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            img_array = decode_payload(body, self.headers.get("Content-Type"))
+        except Exception as e:
+            self._send_json(400, {"error": f"Could not decode digit: {e}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            probabilities = self.server.batcher.predict(img_array, timeout=self.server.request_timeout)
+        except Exception as e:
+            self._send_json(500, {"error": f"Prediction failed: {e}"})
+            return
+        self._send_json(200, {
+            "digit": int(np.argmax(probabilities)),
+            "confidence": float(np.max(probabilities)),
+            "probabilities": [float(p) for p in probabilities],
+            "latency_ms": (time.perf_counter() - start) * 1000.0,
+        })
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate the cost of a single prediction
+        pass
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections under bursts of concurrent clients
+    request_queue_size = 256
+
+    def __init__(self, address, batcher, request_timeout=10.0):
+        super().__init__(address, InferenceRequestHandler)
+        self.batcher = batcher
+        self.request_timeout = request_timeout
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve digit predictions over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default=None, help="Model file (default: bundled best_model.keras)")
+    parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--registry", default=None,
+                        help="Serve the active version of a model registry and hot-swap new ones")
+    parser.add_argument("--registry-interval", type=float, default=WATCH_INTERVAL_S)
+    args = parser.parse_args(argv)
+
+    watcher = None
+    if args.registry:
+        backend, watcher = serve_from_registry(args.registry, args.backend, args.registry_interval)
+    else:
+        backend = create_backend(args.backend, args.model or resource_path(MODEL_PATH))
+        backend.warmup()
+    batcher = DynamicBatcher(backend, args.max_batch_size, args.max_wait_ms)
+    server = InferenceServer((args.host, args.port), batcher)
+    print(f"Serving {backend.name} predictions on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+        if watcher is not None:
+            watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
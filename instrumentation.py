@@ -0,0 +1,242 @@
+"""Lightweight in-process instrumentation: timers, counters, gauges and rolling latency histograms.
+
+Everything is recorded in memory (a perf_counter call and a deque append per timed call) and can
+be inspected in the app's debug panel or exported as JSON / Prometheus text, either to a file
+rewritten periodically or over HTTP on a local port:
+
+    python digit_predictor.py --metrics-port 9100      # curl http://127.0.0.1:9100/metrics
+    python digit_predictor.py --metrics-file metrics.prom
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from inference import LatencyTracker
+
+# Histogram bucket upper bounds in seconds (0.5 ms .. 2.5 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+METRIC_PREFIX = "digit_app_"
+EXPORT_INTERVAL_S = 10.0
+
+
+def current_rss_mb():
+    """Resident set size of this process in MiB (Linux /proc, psutil if installed, else peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows without psutil
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024.0
+
+
+class RollingHistogram(LatencyTracker):
+    """Latency tracker that also keeps cumulative bucket counts, total count, sum and max.
+
+    Percentiles come from the rolling window (recent behaviour); buckets, count and sum cover
+    the whole process lifetime, as Prometheus histograms expect.
+    """
+
+    def __init__(self, window=1000, buckets=DEFAULT_BUCKETS):
+        super().__init__(window)
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            super().record(seconds)
+            self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            return super().percentile(q)
+
+    def summary(self):
+        summary = super().summary()
+        summary.update({"total_count": self.count, "mean_ms": self.total / self.count * 1000.0 if self.count else 0.0,
+                        "max_ms": self.max * 1000.0})
+        return summary
+
+
+class Instrumentation:
+    """Named counters, gauges and timers shared by the UI thread and worker threads."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}  # name -> value or zero-argument callable sampled at export time
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, RollingHistogram(self.window))
+        return histogram
+
+    def observe(self, name, seconds):
+        self.histogram(name).record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator form of `timer`."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _gauge_values(self):
+        values = {}
+        for name, value in list(self.gauges.items()):
+            try:
+                values[name] = float(value() if callable(value) else value)
+            except Exception:
+                values[name] = float("nan")
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "uptime_s": time.time() - self.started,
+            "counters": counters,
+            "gauges": self._gauge_values(),
+            "timers": {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """Prometheus text exposition format (counters, gauges, histograms and recent quantiles)."""
+        lines = [f"# TYPE {prefix}uptime_seconds gauge", f"{prefix}uptime_seconds {time.time() - self.started:.3f}"]
+        with self._lock:
+            counters = dict(self.counters)
+        for name, value in sorted(counters.items()):
+            lines += [f"# TYPE {prefix}{name}_total counter", f"{prefix}{name}_total {value}"]
+        for name, value in sorted(self._gauge_values().items()):
+            lines += [f"# TYPE {prefix}{name} gauge", f"{prefix}{name} {value:g}"]
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f"{prefix}{name}_seconds"
+            with histogram._lock:
+                counts, count, total = list(histogram.bucket_counts), histogram.count, histogram.total
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+            lines += [f"{metric}_sum {total:.6f}", f"{metric}_count {count}"]
+            lines.append(f"# TYPE {prefix}{name}_recent_seconds summary")
+            for q in (0.5, 0.9, 0.99):
+                value = histogram.percentile(q * 100) / 1000.0
+                lines.append(f'{prefix}{name}_recent_seconds{{quantile="{q:g}"}} {value:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text) and /metrics.json."""
+
+    def do_GET(self):
+        instrumentation = self.server.instrumentation
+        if self.path == "/metrics":
+            body, content_type = instrumentation.to_prometheus(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = instrumentation.to_json(), "application/json"
+        else:
+            self.send_error(404, "Unknown endpoint")
+            return
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+
+class MetricsExporter:
+    """Publish an Instrumentation's metrics to a file (rewritten every `interval_s`) and/or a port.
+
+    Files ending in `.json` get the JSON snapshot, anything else Prometheus text (suitable for
+    node_exporter's textfile collector). The HTTP server only listens on `host` (localhost).
+    """
+
+    def __init__(self, instrumentation, path=None, port=None, host="127.0.0.1", interval_s=EXPORT_INTERVAL_S):
+        self.instrumentation = instrumentation
+        self.path = path
+        self.interval_s = interval_s
+        self.server = None
+        self._stop = threading.Event()
+        if port is not None:
+            self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+            self.server.daemon_threads = True
+            self.server.instrumentation = instrumentation
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        if path:
+            threading.Thread(target=self._write_loop, name="metrics-file", daemon=True).start()
+
+    def write(self):
+        body = self.instrumentation.to_json() if self.path.endswith(".json") else self.instrumentation.to_prometheus()
+        # Write-then-rename so readers never see a half-written file
+        with open(self.path + ".tmp", "w") as f:
+            f.write(body)
+        os.replace(self.path + ".tmp", self.path)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self.path:
+            self.write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
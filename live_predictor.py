@@ -0,0 +1,75 @@
+import threading
+
+
+class LivePredictionWorker:
+    """Run predictions on a background thread, keeping only the newest request.
+
+    `submit` replaces whatever is still waiting, so a burst of drawing events costs one
+    inference for the latest canvas state. Results are handed to `post` (for the Tk app,
+    `master.after(0, ...)`) so the callback runs on the UI thread; a result is dropped if a
+    newer request was submitted or `cancel` was called while it was in flight.
+    """
+
+    def __init__(self, predict_fn, on_result, post, on_error=None):
+        self.predict_fn = predict_fn
+        self.on_result = on_result
+        self.on_error = on_error
+        self.post = post
+        self._condition = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="live-prediction", daemon=True)
+        self._thread.start()
+
+    def submit(self, model_input):
+        """Queue `model_input` for prediction, replacing any request not yet started."""
+        with self._condition:
+            self._generation += 1
+            self._pending = (self._generation, model_input)
+            self._condition.notify()
+
+    def cancel(self):
+        """Drop the pending request and any result still in flight."""
+        with self._condition:
+            self._generation += 1
+            self._pending = None
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._pending = None
+            self._condition.notify()
+        self._thread.join(timeout=1.0)
+
+    def _is_current(self, generation):
+        with self._condition:
+            return generation == self._generation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._pending is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                generation, model_input = self._pending
+                self._pending = None
+
+            try:
+                result = self.predict_fn(model_input)
+            except Exception as e:
+                if self.on_error is not None and self._is_current(generation):
+                    self._post(lambda e=e: self.on_error(e))
+                continue
+
+            if self._is_current(generation):
+                # Checked again on the UI thread: a newer request may arrive while the callback is queued
+                self._post(lambda: self._is_current(generation) and self.on_result(result))
+
+    def _post(self, callback):
+        try:
+            self.post(callback)
+        except Exception:
+            # The UI main loop is gone (window closed); nothing left to update
+            pass
@@ -0,0 +1,396 @@
+"""Versioned model registry with background hot-reload.
+
+Layout of a registry directory:
+
+    models/
+        v0001/best_model.keras  v0001/metadata.json
+        v0002/best_model.tflite v0002/metadata.json
+        CURRENT                 # name of the version to serve
+        HISTORY                 # versions activated so far, one per line; rollback pops the last
+        check.npz               # optional: images/labels every new version must classify
+
+Versions are immutable: `publish` copies the model into a hidden temporary directory, loads
+and checks it there, writes its metadata and renames it into place, so a watcher never sees a
+half-copied or unloadable model. Serving processes (the app with --registry,
+inference_server.py --registry) run a RegistryWatcher that polls CURRENT, loads and
+warm-up-checks a new version on a background thread, then swaps it into a HotSwapBackend in
+one assignment. `rollback` returns to the previously *active* version, which the watcher still
+has loaded, so it takes effect on the next poll without reloading anything.
+
+Usage:
+    python model_registry.py publish models best_model.keras --notes "retrained on saved digits"
+    python model_registry.py list models
+    python model_registry.py rollback models
+    python model_registry.py activate models v0002
+"""
+import os
+import json
+import time
+import sys
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import numpy as np
+from datetime import datetime, timezone
+
+from backends import InferenceBackend, create_backend
+from preprocessing import PREDICTION_IMAGE_SIZE, to_model_input
+
+CURRENT_FILE = "CURRENT"
+HISTORY_FILE = "HISTORY"
+METADATA_FILE = "metadata.json"
+CHECK_FILE = "check.npz"
+VERSION_PREFIX = "v"
+WATCH_INTERVAL_S = 5.0
+DEFAULT_MIN_CHECK_ACCURACY = 0.9
+
+
+class ModelRegistry:
+    """A directory of immutable, numbered model versions plus a CURRENT pointer."""
+
+    def __init__(self, root):
+        self.root = os.path.expanduser(root)
+
+    def versions(self):
+        """Published versions, oldest first (directories whose metadata has been written)."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if name.startswith(VERSION_PREFIX) and name[len(VERSION_PREFIX):].isdigit()
+                      and os.path.exists(os.path.join(self.root, name, METADATA_FILE)))
+
+    def metadata(self, version):
+        with open(os.path.join(self.root, version, METADATA_FILE)) as f:
+            return json.load(f)
+
+    def model_path(self, version):
+        return os.path.join(self.root, version, self.metadata(version)["model_file"])
+
+    def active_version(self):
+        """The version named in CURRENT, or the newest one if there is no pointer yet."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            versions = self.versions()
+            return versions[-1] if versions else None
+        return version or None
+
+    def history(self):
+        """Versions activated so far, oldest first."""
+        try:
+            with open(os.path.join(self.root, HISTORY_FILE)) as f:
+                return f.read().split()
+        except FileNotFoundError:
+            return []
+
+    def _write(self, filename, lines):
+        path = os.path.join(self.root, filename)
+        with open(path + ".tmp", "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(path + ".tmp", path)
+
+    def set_active(self, version):
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version {version!r} in {self.root}")
+        history = self.history()
+        if not history or history[-1] != version:
+            self._write(HISTORY_FILE, history + [version])
+        self._write(CURRENT_FILE, [version])
+
+    def rollback(self):
+        """Point CURRENT back at the version that was active before the current one; returns it."""
+        history = self.history()
+        active = self.active_version()
+        if history and history[-1] == active:
+            history.pop()
+        if not history:
+            raise ValueError(f"No previously active version to roll back to from {active!r}")
+        self._write(HISTORY_FILE, history)
+        self._write(CURRENT_FILE, [history[-1]])
+        return history[-1]
+
+    def publish(self, model_path, activate=True, backend=None, metrics=None, notes=None,
+                min_check_accuracy=DEFAULT_MIN_CHECK_ACCURACY):
+        """Check and copy `model_path` in as the next version; returns the new version name.
+
+        Raises (and publishes nothing) if the model cannot be loaded or fails the check.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(model_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        staging = tempfile.mkdtemp(prefix=".publish-", dir=self.root)
+        model_file = os.path.basename(model_path)
+        shutil.copy2(model_path, os.path.join(staging, model_file))
+        try:
+            load_model(os.path.join(staging, model_file), backend, self.check_data(), min_check_accuracy)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        versions = self.versions()
+        number = int(versions[-1][len(VERSION_PREFIX):]) + 1 if versions else 1
+        version = f"{VERSION_PREFIX}{number:04d}"
+        metadata = {
+            "version": version,
+            "model_file": model_file,
+            "source": os.path.abspath(model_path),
+            "sha256": digest,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "backend": backend,
+            "metrics": metrics or {},
+            "min_check_accuracy": min_check_accuracy,
+            "notes": notes,
+        }
+        with open(os.path.join(staging, METADATA_FILE), "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging, os.path.join(self.root, version))
+        if activate:
+            self.set_active(version)
+        return version
+
+    def check_data(self):
+        """(images, labels) every new version must classify, if the registry has a check.npz."""
+        path = os.path.join(self.root, CHECK_FILE)
+        if not os.path.exists(path):
+            return None
+        from digit_dataset import load_labeled_digits
+        return load_labeled_digits(path)
+
+
+def validate_backend(backend, check_data=None, min_accuracy=DEFAULT_MIN_CHECK_ACCURACY):
+    """Warm-up check: well-formed probabilities, and accuracy on `check_data` if given."""
+    blank = np.zeros((1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE), dtype=np.uint8)
+    images, labels = check_data if check_data is not None else (blank, None)
+    probabilities = np.asarray(backend.predict(to_model_input(images)))
+    if probabilities.shape != (len(images), 10):
+        raise ValueError(f"Expected ({len(images)}, 10) probabilities, got {probabilities.shape}")
+    if not np.all(np.isfinite(probabilities)) or not np.allclose(probabilities.sum(axis=1), 1.0, atol=1e-2):
+        raise ValueError("Model output is not a probability distribution")
+    if labels is not None:
+        accuracy = float(np.mean(np.argmax(probabilities, axis=1) == labels))
+        if accuracy < min_accuracy:
+            raise ValueError(f"Check accuracy {accuracy:.3f} below {min_accuracy:.3f}")
+
+
+def load_model(model_path, backend_name=None, check_data=None, min_accuracy=DEFAULT_MIN_CHECK_ACCURACY):
+    """Load, warm up and validate a model file; raises if it must not be served."""
+    backend = create_backend(backend_name, model_path)
+    backend.warmup()
+    validate_backend(backend, check_data, min_accuracy)
+    return backend
+
+
+def load_version(registry, version, backend_name=None):
+    """Load, warm up and validate one registry version; raises if it must not be served."""
+    metadata = registry.metadata(version)
+    return load_model(registry.model_path(version), backend_name or metadata.get("backend"),
+                      registry.check_data(), metadata.get("min_check_accuracy", DEFAULT_MIN_CHECK_ACCURACY))
+
+
+class HotSwapBackend(InferenceBackend):
+    """Backend slot whose engine can be replaced while other threads keep predicting.
+
+    `predict` reads the (backend, version) pair once, so every call runs entirely on one
+    version; `swap` replaces the pair in a single assignment. Rollbacks arrive as swaps from
+    the RegistryWatcher, which keeps the previously active backend loaded.
+    """
+
+    def __init__(self, backend, version=None):
+        self.active = (backend, version)
+
+    @property
+    def name(self):
+        return self.active[0].name
+
+    @property
+    def version(self):
+        return self.active[1]
+
+    def predict(self, batch):
+        backend, _ = self.active
+        return backend.predict(batch)
+
+    def swap(self, backend, version=None):
+        self.active = (backend, version)
+
+
+class RegistryWatcher:
+    """Poll a registry and hand each newly activated, validated version to `on_loaded`.
+
+    Loading happens on the watcher thread; `on_loaded(backend, version, metadata)` is also
+    called there, so UI callers should post it to their own thread. The active and previously
+    active versions stay loaded; switching back to either is immediate. If the active version
+    cannot be loaded before anything is served, the most recently active loadable version is
+    served instead.
+
+    `on_error(version, exception)` reports each version that fails to load; the current model
+    (or a fallback) keeps being served. `on_error(None, exception)` means nothing can be
+    served: no version loads or the registry cannot be read.
+    """
+
+    def __init__(self, registry, on_loaded, on_error=None, backend_name=None, interval_s=WATCH_INTERVAL_S):
+        self.registry = registry
+        self.on_loaded = on_loaded
+        self.on_error = on_error
+        self.backend_name = backend_name
+        self.interval_s = interval_s
+        self.current = None
+        self.loaded = {}   # version -> backend, at most the active and the previous one
+        self.failed = set()  # Versions are immutable, so a failed one is never retried
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check_once(self):
+        """Load the active version if it changed; returns True if a new version was handed over."""
+        target = self.registry.active_version()
+        if target is None:
+            if self.current is None:
+                self._report(None, RuntimeError(f"No model version published in {self.registry.root}"))
+            return False
+        if target == self.current or target in self.failed:
+            return False
+        backend = self.loaded.get(target)
+        if backend is None:
+            backend = self._load(target)
+        if backend is None and self.current is None:
+            # Nothing served yet: fall back to the last version that was active and still loads
+            for candidate in self._fallbacks():
+                backend = self._load(candidate)
+                if backend is not None:
+                    target = candidate
+                    break
+        if backend is None:
+            if self.current is None:
+                self._report(None, RuntimeError(f"No loadable model version in {self.registry.root}"))
+            return False
+        previous, self.current = self.current, target
+        self.loaded = {version: b for version, b in {**self.loaded, target: backend}.items()
+                       if version in (target, previous)}
+        self.on_loaded(backend, target, self.registry.metadata(target))
+        return True
+
+    def _load(self, version):
+        try:
+            return load_version(self.registry, version, self.backend_name)
+        except Exception as e:
+            self.failed.add(version)
+            self._report(version, e)
+            return None
+
+    def _report(self, version, e):
+        if self.on_error is not None:
+            self.on_error(version, e)
+
+    def _fallbacks(self):
+        """Previously active versions, most recent first, then the rest newest first."""
+        candidates = list(reversed(self.registry.history())) + list(reversed(self.registry.versions()))
+        return [v for i, v in enumerate(candidates) if v not in self.failed and v not in candidates[:i]]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="model-registry-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.check_once()
+            except Exception as e:  # e.g. registry on a network share briefly unavailable
+                self._report(None, e)
+            self._stop.wait(self.interval_s)
+
+    def stop(self):
+        self._stop.set()
+
+
+def serve_from_registry(root, backend_name=None, interval_s=WATCH_INTERVAL_S):
+    """Load the active version now and keep the returned HotSwapBackend current in the background.
+
+    Returns (backend, watcher). For headless services; the Tk app drives RegistryWatcher itself
+    so swaps happen on the UI thread.
+    """
+    registry = ModelRegistry(root)
+    slot = None
+
+    def on_loaded(backend, version, metadata):
+        nonlocal slot
+        if slot is None:
+            slot = HotSwapBackend(backend, version)
+        else:
+            slot.swap(backend, version)
+            print(f"Now serving model {version}")
+
+    def on_error(version, e):
+        print(f"Model {version or '(registry)'} not activated: {e}")
+
+    watcher = RegistryWatcher(registry, on_loaded, on_error, backend_name, interval_s)
+    if not watcher.check_once():
+        raise RuntimeError(f"No loadable model version in {registry.root}")
+    return slot, watcher.start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage a versioned model registry.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = commands.add_parser("publish", help="Add a model as the next version")
+    publish_parser.add_argument("registry")
+    publish_parser.add_argument("model")
+    publish_parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None)
+    publish_parser.add_argument("--notes", default=None)
+    publish_parser.add_argument("--no-activate", action="store_true", help="Publish without serving it yet")
+    publish_parser.add_argument("--eval-data", default=None,
+                                help="DigitStore to evaluate on; accuracy is stored in the metadata")
+
+    list_parser = commands.add_parser("list", help="Show versions and which one is active")
+    list_parser.add_argument("registry")
+
+    activate_parser = commands.add_parser("activate", help="Serve a specific version")
+    activate_parser.add_argument("registry")
+    activate_parser.add_argument("version")
+
+    rollback_parser = commands.add_parser("rollback", help="Serve the previously active version again")
+    rollback_parser.add_argument("registry")
+    args = parser.parse_args(argv)
+
+    registry = ModelRegistry(args.registry)
+    if args.command == "publish":
+        metrics = {}
+        if args.eval_data:
+            from digit_dataset import DigitStore, evaluate
+            start = time.perf_counter()
+            accuracy, _ = evaluate(DigitStore(args.eval_data), create_backend(args.backend, args.model))
+            metrics = {"accuracy": accuracy, "eval_data": os.path.abspath(args.eval_data),
+                       "eval_time_s": time.perf_counter() - start}
+        try:
+            version = registry.publish(args.model, activate=not args.no_activate, backend=args.backend,
+                                       metrics=metrics, notes=args.notes)
+        except Exception as e:
+            sys.exit(f"Not published: {args.model} failed the load check ({e})")
+        print(f"Published {args.model} as {version}" + ("" if args.no_activate else " (active)"))
+    elif args.command == "list":
+        active = registry.active_version()
+        for version in registry.versions():
+            metadata = registry.metadata(version)
+            accuracy = metadata["metrics"].get("accuracy")
+            print(f"{'*' if version == active else ' '} {version}  {metadata['created']}  {metadata['model_file']}"
+                  + (f"  acc {accuracy * 100:.2f}%" if accuracy is not None else "")
+                  + (f"  {metadata['notes']}" if metadata.get("notes") else ""))
+    elif args.command == "activate":
+        try:
+            registry.set_active(args.version)
+        except ValueError as e:
+            sys.exit(f"Not activated: {e}")
+        print(f"Active version: {args.version}")
+    else:
+        try:
+            print(f"Rolled back to {registry.rollback()}")
+        except ValueError as e:
+            sys.exit(f"Not rolled back: {e}")
+
+
+if __name__ == "__main__":
+    main()
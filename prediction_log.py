@@ -0,0 +1,277 @@
+"""Persistent log of every prediction, for finding hard cases and feeding corrections back into training.
+
+The log is a DigitStore with extra columns, so each field is a raw append-only file that is
+memory-mapped for queries:
+
+    images.u8         uint8 (N, 28, 28)  model input as the app preprocessed it
+    labels.u8         uint8 (N,)         user-corrected label, 255 until corrected
+    probabilities.f2  float16 (N, 10)
+    latency_ms.f4     float32 (N,)       0 for answers served from the prediction cache
+    timestamps.f8     float64 (N,)       unix time
+    version_ids.u2    uint16 (N,)        index into meta.json "model_versions"
+    kinds.u1          uint8 (N,)         KIND_BUTTON, KIND_LIVE or KIND_SEGMENT
+
+Corrected rows train like any other labelled digit: `python train.py --data <log>` or
+`python prediction_log.py export <log> data/train`.
+
+Usage:
+    python prediction_log.py summary ~/saved_digits/prediction_log
+    python prediction_log.py low-confidence ~/saved_digits/prediction_log --threshold 0.7
+    python prediction_log.py confusion ~/saved_digits/prediction_log
+    python prediction_log.py export ~/saved_digits/prediction_log data/train
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+
+from digit_dataset import DigitStore, UNLABELED
+
+KIND_BUTTON = 0   # "Predict Digit" pressed
+KIND_LIVE = 1     # "Predict as I draw" update
+KIND_SEGMENT = 2  # One digit of a multi-digit prediction
+KIND_NAMES = {KIND_BUTTON: "button", KIND_LIVE: "live", KIND_SEGMENT: "segment"}
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), "saved_digits", "prediction_log")
+WRITE_BATCH_SIZE = 256
+CORRECTABLE_ROWS = 1024  # How many recent predictions a correction can still reach
+
+
+class PredictionLog(DigitStore):
+    """Columnar, append-only record of predictions with vectorized queries."""
+
+    COLUMNS = {
+        **DigitStore.COLUMNS,
+        "probabilities": ("probabilities.f2", np.float16, (10,)),
+        "latency_ms": ("latency_ms.f4", np.float32, ()),
+        "timestamps": ("timestamps.f8", np.float64, ()),
+        "version_ids": ("version_ids.u2", np.uint16, ()),
+        "kinds": ("kinds.u1", np.uint8, ()),
+    }
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.meta.setdefault("model_versions", [])
+
+    def version_id(self, model_version):
+        """Index of `model_version` in meta.json, registering it (saved with the next append)."""
+        versions = self.meta["model_versions"]
+        if model_version not in versions:
+            versions.append(model_version)
+        return versions.index(model_version)
+
+    def set_label(self, index, label):
+        """Record the user's correction for row `index`; the only in-place write to the log."""
+        if not 0 <= index < self.count:
+            raise IndexError(f"Row {index} not in log of {self.count}")
+        with open(os.path.join(self.path, self.LABELS_FILE), "r+b") as f:
+            f.seek(index)
+            f.write(bytes([label]))
+
+    # --- Queries (vectorized over the memory-mapped columns) ---
+    def predicted(self):
+        return np.argmax(self.probabilities, axis=1)
+
+    def confidences(self):
+        return self.probabilities.max(axis=1).astype(np.float32)
+
+    def select(self, max_confidence=None, min_confidence=None, kind=None, model_version=None,
+               labeled=None, misclassified=None, since=None):
+        """Row indices matching every given filter."""
+        mask = np.ones(self.count, dtype=bool)
+        if max_confidence is not None or min_confidence is not None:
+            confidences = self.confidences()
+            if max_confidence is not None:
+                mask &= confidences < max_confidence
+            if min_confidence is not None:
+                mask &= confidences >= min_confidence
+        if kind is not None:
+            mask &= self.kinds == kind
+        if model_version is not None:
+            versions = self.meta["model_versions"]
+            mask &= self.version_ids == (versions.index(model_version) if model_version in versions else -1)
+        if labeled is not None:
+            mask &= (self.labels != UNLABELED) == labeled
+        if misclassified is not None:
+            mask &= ((self.labels != UNLABELED) & (self.labels != self.predicted())) == misclassified
+        if since is not None:
+            mask &= self.timestamps >= since
+        return np.flatnonzero(mask)
+
+    def confusion_matrix(self, indices=None):
+        """10x10 counts of corrected label (rows) vs predicted digit (columns)."""
+        indices = self.select(labeled=True) if indices is None else indices
+        labels = self.labels[indices].astype(np.int64)
+        predicted = self.predicted()[indices]
+        return np.bincount(labels * 10 + predicted, minlength=100).reshape(10, 10)
+
+    def summary(self, threshold=0.7):
+        confidences = self.confidences()
+        labeled = self.labels != UNLABELED
+        summary = {
+            "count": self.count,
+            "corrected": int(labeled.sum()),
+            "low_confidence": int((confidences < threshold).sum()),
+            "per_kind": {KIND_NAMES.get(k, str(k)): int(n) for k, n in enumerate(np.bincount(self.kinds))
+                         if n},
+            "per_model": {},
+        }
+        for version_id, version in enumerate(self.meta["model_versions"]):
+            rows = self.version_ids == version_id
+            if not rows.any():
+                continue
+            computed = rows & (self.latency_ms > 0)  # Cache hits do not reach the model
+            rows_labeled = rows & labeled
+            summary["per_model"][version] = {
+                "count": int(rows.sum()),
+                "mean_confidence": float(confidences[rows].mean()),
+                "p50_latency_ms": float(np.median(self.latency_ms[computed])) if computed.any() else None,
+                "accuracy_on_corrected": (float(np.mean(self.labels[rows_labeled] == self.predicted()[rows_labeled]))
+                                          if rows_labeled.any() else None),
+            }
+        return summary
+
+    def export(self, store_path, indices=None):
+        """Append rows (default: every corrected one) to a training DigitStore; returns the count."""
+        indices = self.select(labeled=True) if indices is None else np.asarray(indices)
+        if len(indices):
+            DigitStore.create(store_path).append(self.images[indices], self.labels[indices],
+                                                 source=os.path.abspath(self.path))
+        return len(indices)
+
+
+class PredictionLogWriter:
+    """Queue predictions and corrections from the UI thread; a background thread writes them.
+
+    `record` returns a ticket immediately, so a correction can be queued before its row is on
+    disk. The writer maps tickets to rows from the log's count after each successful append;
+    a correction for a row that failed to write (or is too old) is dropped, never misapplied.
+    """
+
+    def __init__(self, path=DEFAULT_LOG_DIR, batch_size=WRITE_BATCH_SIZE):
+        self.log = PredictionLog.create(path)
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_ticket = 0
+        self._rows = {}  # ticket -> row index, for the most recent CORRECTABLE_ROWS written rows
+        self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+        self._thread.start()
+
+    def record(self, image, probabilities, model_version, latency_ms=0.0, kind=KIND_BUTTON):
+        """Queue one prediction; `image` is the (28, 28) uint8 model input. Returns its ticket."""
+        row = (np.array(image, dtype=np.uint8), np.array(probabilities, dtype=np.float32).reshape(10),
+               float(latency_ms), time.time(), model_version, kind)
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._queue.put(("row", (ticket, row)))
+        return ticket
+
+    def correct(self, ticket, label):
+        self._queue.put(("label", (ticket, label)))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = []
+            for item in items:
+                if item is None:
+                    stopping = True
+                elif item[0] == "row":
+                    rows.append(item[1])
+                else:
+                    self._write(rows)  # The labelled row must be on disk first
+                    rows = []
+                    self._correct(*item[1])
+            self._write(rows)
+
+    def _write(self, rows):
+        if not rows:
+            return
+        tickets, rows = zip(*rows)
+        images, probabilities, latencies, timestamps, versions, kinds = zip(*rows)
+        start = len(self.log)
+        try:
+            self.log.append_columns({
+                "images": np.stack(images),
+                "labels": np.full(len(rows), UNLABELED, dtype=np.uint8),
+                "probabilities": np.stack(probabilities),
+                "latency_ms": latencies,
+                "timestamps": timestamps,
+                "version_ids": [self.log.version_id(version) for version in versions],
+                "kinds": kinds,
+            })
+        except Exception as e:
+            # Logging must never take the app down (disk full, file removed, ...); these rows
+            # are lost and get no row index, so their corrections are dropped
+            print(f"Prediction log write failed: {e}")
+            return
+        self._rows.update((ticket, start + i) for i, ticket in enumerate(tickets))
+        for ticket in [t for t in self._rows if t <= tickets[-1] - CORRECTABLE_ROWS]:
+            del self._rows[ticket]
+
+    def _correct(self, ticket, label):
+        index = self._rows.get(ticket)
+        if index is None:
+            print(f"Prediction log: correction dropped, prediction {ticket} was not written")
+            return
+        try:
+            self.log.set_label(index, label)
+        except Exception as e:
+            print(f"Prediction log write failed: {e}")
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def main(argv=None):
+    import json
+
+    parser = argparse.ArgumentParser(description="Query and export the app's prediction log.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary_parser = commands.add_parser("summary", help="Counts, corrections and per-model statistics")
+    summary_parser.add_argument("log")
+    low_parser = commands.add_parser("low-confidence", help="Least confident predictions")
+    low_parser.add_argument("log")
+    low_parser.add_argument("--threshold", type=float, default=0.7)
+    low_parser.add_argument("--limit", type=int, default=20)
+    confusion_parser = commands.add_parser("confusion", help="Corrected label vs predicted digit")
+    confusion_parser.add_argument("log")
+    export_parser = commands.add_parser("export", help="Append corrected digits to a training DigitStore")
+    export_parser.add_argument("log")
+    export_parser.add_argument("store")
+    args = parser.parse_args(argv)
+
+    log = PredictionLog(os.path.expanduser(args.log))
+    if args.command == "summary":
+        print(json.dumps(log.summary(), indent=2))
+    elif args.command == "low-confidence":
+        indices = log.select(max_confidence=args.threshold)
+        confidences = log.confidences()
+        predicted = log.predicted()
+        print(f"{len(indices)} predictions below {args.threshold}")
+        for index in indices[np.argsort(confidences[indices])][:args.limit]:
+            label = log.labels[index]
+            print(f"  #{index}: predicted {predicted[index]} ({confidences[index]:.2f})"
+                  + (f", corrected to {label}" if label != UNLABELED else ""))
+    elif args.command == "confusion":
+        matrix = log.confusion_matrix()
+        print("true\\pred " + " ".join(f"{d:>5}" for d in range(10)))
+        for digit, row in enumerate(matrix):
+            print(f"{digit:>9} " + " ".join(f"{n:>5}" for n in row))
+    else:
+        print(f"Exported {log.export(args.store)} corrected digits to {args.store}")
+
+
+if __name__ == "__main__":
+    main()
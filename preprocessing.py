@@ -0,0 +1,199 @@
+import numpy as np
+from PIL import Image
+
+# --- Canvas geometry ---
+# Shared by the Tkinter app and the headless tools so both see the same 28x28 input.
+CANVAS_SIZE = 280
+PREDICTION_IMAGE_SIZE = 28
+
+# Guide box parameters
+GUIDE_BOX_WIDTH = int(CANVAS_SIZE * 0.8)
+GUIDE_BOX_HEIGHT = int(CANVAS_SIZE * 0.8)
+GUIDE_BOX_START_X = (CANVAS_SIZE - GUIDE_BOX_WIDTH) // 2
+GUIDE_BOX_START_Y = (CANVAS_SIZE - GUIDE_BOX_HEIGHT) // 2
+GUIDE_BOX_END_X = GUIDE_BOX_START_X + GUIDE_BOX_WIDTH
+GUIDE_BOX_END_Y = GUIDE_BOX_START_Y + GUIDE_BOX_HEIGHT
+GUIDE_BOX_REGION = (GUIDE_BOX_START_X, GUIDE_BOX_START_Y, GUIDE_BOX_END_X, GUIDE_BOX_END_Y)
+# Each 28x28 output pixel is the mean of one GUIDE_BOX_SCALE x GUIDE_BOX_SCALE block of the guide box
+GUIDE_BOX_SCALE = GUIDE_BOX_WIDTH // PREDICTION_IMAGE_SIZE
+
+
+MNIST_DIGIT_BOX = 20  # MNIST digits are scaled to fit a 20x20 box inside the 28x28 frame
+BOX_INK_THRESHOLD = 32  # Ink below this (0-255) is anti-aliasing fuzz and does not extend the bounding box
+NORMALIZE_GROUP_SIZE = 256  # Digits resampled together by one pair of batched matmuls
+
+
+def is_blank_canvas(image):
+    """Return True if a drawing canvas (black ink on white) has no ink at all."""
+    return image.convert("L").getextrema()[0] == 255
+
+
+def preprocess_canvas_image(image):
+    """Turn a 280x280 drawing canvas into a 28x28 uint8 array (white ink on black, like MNIST)."""
+    img_cropped = image.convert("L").crop(GUIDE_BOX_REGION)
+    # Block averaging keeps every output pixel local, which IncrementalRaster relies on
+    img_resized = img_cropped.reduce(GUIDE_BOX_SCALE)
+    return 255 - np.array(img_resized)
+
+
+def preprocess_image(image, center=True):
+    """Preprocess any digit image (dark ink on a light background) into a 28x28 uint8 array.
+
+    The one preprocessing entry point shared by the app, batch inference, the server and
+    dataset ingestion. By default all ink is fitted and centered MNIST-style. With
+    `center=False`, images with the canvas size are treated like saved canvases and cropped
+    to the guide box, anything else is resized as a whole.
+    """
+    image = image.convert("L")
+    if center:
+        return normalize_canvas_image(image)
+    if image.size == (CANVAS_SIZE, CANVAS_SIZE):
+        return preprocess_canvas_image(image)
+    img_resized = image.resize((PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE),
+                               Image.Resampling.LANCZOS)
+    return 255 - np.array(img_resized)
+
+
+def _area_weights(lo, hi, length):
+    """(N, 28, length) weights averaging source pixels [lo, hi) of each output pixel, by overlap."""
+    pixels = np.arange(length, dtype=np.float32)
+    overlap = np.minimum(hi[..., None], pixels + 1) - np.maximum(lo[..., None], pixels)
+    return np.clip(overlap, 0, None) / (hi - lo)[..., None]
+
+
+def mnist_normalize(ink, digit_box=MNIST_DIGIT_BOX):
+    """MNIST-style normalization of white-on-black ink of any size into 28x28 uint8 arrays.
+
+    Each digit's bounding box is scaled (aspect preserved) to fit a `digit_box` square and the
+    result is placed so its center of mass lands on the middle of the frame. Takes one (H, W)
+    array or an (N, H, W) batch, with the same result per image either way (up to float32
+    rounding, rarely one gray level). A batch is sorted by box size and resampled
+    NORMALIZE_GROUP_SIZE digits at a time with two batched matmuls of per-image
+    area-averaging matrices. Blank images come back blank.
+    """
+    ink = np.asarray(ink)
+    single = ink.ndim == 2
+    ink = ink.reshape((-1,) + ink.shape[-2:])
+
+    # Bounding box of the visible ink, per image
+    mask = ink >= BOX_INK_THRESHOLD
+    rows, cols = mask.any(axis=2), mask.any(axis=1)
+    has_ink = rows.any(axis=1)
+    top, left = rows.argmax(axis=1), cols.argmax(axis=1)
+    bottom = ink.shape[1] - rows[:, ::-1].argmax(axis=1)
+    right = ink.shape[2] - cols[:, ::-1].argmax(axis=1)
+
+    frames = np.zeros((len(ink), PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE), dtype=np.uint8)
+    # Digits of similar size share a group, so little of each group's window is padding
+    inked = np.flatnonzero(has_ink)
+    inked = inked[np.argsort(np.maximum(bottom - top, right - left)[inked], kind="stable")]
+    for start in range(0, len(inked), NORMALIZE_GROUP_SIZE):
+        group = inked[start:start + NORMALIZE_GROUP_SIZE]
+        frames[group] = _normalize_boxes(ink, group, top[group], bottom[group], left[group], right[group],
+                                         digit_box)
+    return frames[0] if single else frames
+
+
+def _normalize_boxes(ink, indices, top, bottom, left, right, digit_box):
+    """Resample the ink boxes of `ink[indices]` into (len(indices), 28, 28) uint8 frames."""
+    count = len(indices)
+    height, width = int((bottom - top).max()), int((right - left).max())
+    scale = digit_box / np.maximum(np.maximum(bottom - top, right - left), 1)
+    # Each box in a window the size of the group's largest one, zeros past its own edge
+    boxes = np.zeros((count, height, width), dtype=np.float32)
+    for i, index in enumerate(indices):
+        boxes[i, :bottom[i] - top[i], :right[i] - left[i]] = ink[index, top[i]:bottom[i], left[i]:right[i]]
+
+    # Center of mass, in continuous coordinates (pixel i spans [i, i + 1))
+    row_mass, col_mass = boxes.sum(axis=2), boxes.sum(axis=1)
+    mass = np.maximum(row_mass.sum(axis=1), 1e-6)
+    cy = row_mass @ (np.arange(height, dtype=np.float32) + 0.5) / mass
+    cx = col_mass @ (np.arange(width, dtype=np.float32) + 0.5) / mass
+
+    # Output pixel j covers source [c + (j - 14.5) / scale, c + (j - 13.5) / scale): the center of
+    # mass lands on pixel 14, as in segmentation and the original MNIST preprocessing
+    edges = np.arange(PREDICTION_IMAGE_SIZE, dtype=np.float32) - PREDICTION_IMAGE_SIZE / 2 - 0.5
+    inverse = (1.0 / scale)[:, None].astype(np.float32)
+    row_weights = _area_weights(cy[:, None] + edges * inverse, cy[:, None] + (edges + 1) * inverse, height)
+    col_weights = _area_weights(cx[:, None] + edges * inverse, cx[:, None] + (edges + 1) * inverse, width)
+    frames = row_weights @ boxes @ col_weights.transpose(0, 2, 1)
+    return np.clip(np.rint(frames), 0, 255).astype(np.uint8)
+
+
+def normalize_canvas_image(image):
+    """Canvas (black ink on white, any size) -> MNIST-normalized 28x28 uint8 array of all its ink."""
+    return mnist_normalize(255 - np.array(image.convert("L")))
+
+
+class IncrementalRaster:
+    """28x28 model input kept up to date from the strokes drawn on the canvas.
+
+    The drawing code reports each segment through `mark_line`; `update` then re-averages
+    only the 8x8 blocks of the guide box touched since the last call instead of the whole
+    280x280 canvas, producing the same array as `preprocess_canvas_image`. `normalized`
+    reads only the region any stroke has touched and produces the same array as
+    `preprocess_image`.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.has_ink = False
+        self.dirty_box = None
+        self.ink_box = None  # Canvas region covering every stroke marked since the reset
+        self.centered = None  # Last `normalized` result, until the next mark
+        # Grayscale of each block (255 = white paper), same orientation as the canvas
+        self.blocks = np.full((PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE), 255, dtype=np.uint8)
+
+    def mark_line(self, x0, y0, x1, y1, width):
+        """Record a segment drawn with the given brush width."""
+        self.has_ink = True
+        pad = width / 2 + 1
+        self.mark_dirty(min(x0, x1) - pad, min(y0, y1) - pad, max(x0, x1) + pad, max(y0, y1) + pad)
+
+    def mark_dirty(self, left, top, right, bottom):
+        self.dirty_box = _union(self.dirty_box, (left, top, right, bottom))
+        self.ink_box = _union(self.ink_box, (left, top, right, bottom))
+        self.centered = None
+
+    def update(self, image):
+        """Refresh the dirty blocks from `image` and return the MNIST-style 28x28 uint8 array."""
+        if self.dirty_box is not None:
+            left, top, right, bottom = self.dirty_box
+            self.dirty_box = None
+            # Dirty box in block coordinates, clipped to the guide box
+            col0 = max(int(left - GUIDE_BOX_START_X) // GUIDE_BOX_SCALE, 0)
+            row0 = max(int(top - GUIDE_BOX_START_Y) // GUIDE_BOX_SCALE, 0)
+            col1 = min(-(-int(np.ceil(right - GUIDE_BOX_START_X)) // GUIDE_BOX_SCALE), PREDICTION_IMAGE_SIZE)
+            row1 = min(-(-int(np.ceil(bottom - GUIDE_BOX_START_Y)) // GUIDE_BOX_SCALE), PREDICTION_IMAGE_SIZE)
+            if col0 < col1 and row0 < row1:
+                region = (GUIDE_BOX_START_X + col0 * GUIDE_BOX_SCALE, GUIDE_BOX_START_Y + row0 * GUIDE_BOX_SCALE,
+                          GUIDE_BOX_START_X + col1 * GUIDE_BOX_SCALE, GUIDE_BOX_START_Y + row1 * GUIDE_BOX_SCALE)
+                self.blocks[row0:row1, col0:col1] = np.array(image.crop(region).reduce(GUIDE_BOX_SCALE))
+        return 255 - self.blocks
+
+    def normalized(self, image):
+        """MNIST-normalized 28x28 uint8 array of all ink, reading only the touched region of `image`."""
+        if self.centered is None:
+            if self.ink_box is None:
+                self.centered = np.zeros((PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE), dtype=np.uint8)
+            else:
+                left, top, right, bottom = self.ink_box
+                region = (max(int(left), 0), max(int(top), 0),
+                          min(int(np.ceil(right)), image.width), min(int(np.ceil(bottom)), image.height))
+                self.centered = normalize_canvas_image(image.crop(region))
+        return self.centered
+
+
+def _union(box, other):
+    if box is None:
+        return other
+    return min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])
+
+
+def to_model_input(img_arrays):
+    """Normalize one (28, 28) or a stack of (N, 28, 28) uint8 arrays into the model's (N, 28, 28, 1) float input."""
+    img_arrays = np.asarray(img_arrays)
+    img_normalized = img_arrays.astype("float32") / 255.0
+    return img_normalized.reshape(-1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1)
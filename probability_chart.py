@@ -0,0 +1,71 @@
+import numpy as np
+
+BACKGROUND_COLOR = '#f0f0f0'  # Also the app window's background, so the chart blends in
+BAR_COLOR = '#4CAF50'
+HIGHLIGHT_COLOR = '#2196F3'
+
+
+def configure_chart_axes(ax):
+    ax.set_ylim(0, 1)
+    ax.set_xlim(-0.5, 9.5)
+    ax.set_xticks(range(10))
+    ax.set_xlabel('Digits (0-9)', fontsize=9)
+    ax.set_ylabel('Probability', fontsize=9)
+    ax.set_title('Digit Probability Distribution', fontsize=11, pad=10)
+    ax.grid(True, linestyle='--', alpha=0.6)
+
+
+class ProbabilityChart:
+    """Bar chart of the 10 digit probabilities, updated by blitting.
+
+    The bars and value labels are created once as animated artists. The static part of the
+    figure (axes, ticks, grid, title) is rendered once and cached; an update only restores
+    that background, redraws the 10 bars and 10 labels and blits the result.
+    """
+
+    def __init__(self, figure, ax, canvas):
+        self.figure = figure
+        self.ax = ax
+        self.canvas = canvas
+        configure_chart_axes(ax)
+        self.bars = ax.bar(range(10), np.zeros(10), color=BAR_COLOR, animated=True)
+        self.labels = [ax.text(i, 0.02, "", color='black', ha='center', fontsize=8, animated=True)
+                       for i in range(10)]
+        self.background = None
+        # Any full draw (first show, window resize) invalidates the cached background
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for bar in self.bars:
+            self.ax.draw_artist(bar)
+        for label in self.labels:
+            self.ax.draw_artist(label)
+
+    def _blit(self):
+        if self.background is None:
+            # Not drawn yet: a full draw renders everything and captures the background
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_animated()
+        self.canvas.blit(self.figure.bbox)
+
+    def update(self, probabilities):
+        """Show one probability vector, highlighting the most likely digit."""
+        predicted_digit = int(np.argmax(probabilities))
+        for i, (bar, label, v) in enumerate(zip(self.bars, self.labels, probabilities)):
+            bar.set_height(v)
+            bar.set_color(HIGHLIGHT_COLOR if i == predicted_digit else BAR_COLOR)
+            label.set_y(v + 0.02)
+            label.set_text(f"{v:.2f}")
+        self._blit()
+
+    def clear(self):
+        for bar, label in zip(self.bars, self.labels):
+            bar.set_height(0)
+            label.set_text("")
+        self._blit()
@@ -0,0 +1,135 @@
+"""Build post-training quantized TFLite variants of best_model.keras and compare them.
+
+Variants:
+- float32:       plain TFLite conversion (baseline for the quantized ones)
+- float16:       weights stored as float16
+- dynamic_int8:  dynamic range quantization (int8 weights, float activations)
+- full_int8:     full-integer quantization calibrated on a representative dataset, int8 input/output
+
+Every variant (and the original Keras model) is benchmarked on a local MNIST-format dataset
+for accuracy, file size, single-sample latency and batch throughput.
+
+Usage:
+    python quantize_model.py --data ~/datasets/mnist --output-dir quantized --accuracy-floor 0.97
+    python digit_predictor.py --model quantized/best_model_full_int8.tflite
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+from backends import KerasBackend, TFLiteBackend, convert_to_tflite
+from digit_dataset import load_labeled_digits
+from inference import LatencyTracker
+from preprocessing import to_model_input
+
+DEFAULT_MODEL_PATH = "best_model.keras"
+VARIANTS = ("float32", "float16", "dynamic_int8", "full_int8")
+CALIBRATION_SAMPLES = 500
+
+
+def quantize(model_path, variant, calibration_images=None):
+    """Return the TFLite flatbuffer for one quantization variant."""
+    import tensorflow as tf
+
+    if variant == "float32":
+        return convert_to_tflite(model_path)
+    if variant == "float16":
+        return convert_to_tflite(model_path, optimizations=[tf.lite.Optimize.DEFAULT],
+                                 supported_types=[tf.float16])
+    if variant == "dynamic_int8":
+        return convert_to_tflite(model_path, optimizations=[tf.lite.Optimize.DEFAULT])
+    if variant == "full_int8":
+        if calibration_images is None or len(calibration_images) == 0:
+            raise ValueError("full_int8 quantization needs calibration images")
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [to_model_input(image)]
+
+        return convert_to_tflite(model_path, optimizations=[tf.lite.Optimize.DEFAULT],
+                                 representative_dataset=representative_dataset, integer_io=True)
+    raise ValueError(f"Unknown variant {variant!r}; choose from {', '.join(VARIANTS)}")
+
+
+def benchmark_backend(backend, images, labels, batch_size=1024, latency_runs=200):
+    """Accuracy, single-sample latency and batch throughput of one backend."""
+    start = time.perf_counter()
+    predictions = []
+    for offset in range(0, len(images), batch_size):
+        probabilities = backend.predict(to_model_input(images[offset:offset + batch_size]))
+        predictions.append(np.argmax(probabilities, axis=1))
+    elapsed = time.perf_counter() - start
+    accuracy = float(np.mean(np.concatenate(predictions) == labels))
+
+    latency = LatencyTracker(latency_runs)
+    for image in images[:latency_runs]:
+        sample = to_model_input(image)
+        call_start = time.perf_counter()
+        backend.predict(sample)
+        latency.record(time.perf_counter() - call_start)
+
+    return {
+        "accuracy": accuracy,
+        "p50_ms": latency.percentile(50),
+        "p99_ms": latency.percentile(99),
+        "images_per_second": len(images) / elapsed if elapsed > 0 else float("inf"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and compare quantized model variants.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--data", required=True, help="MNIST-format dataset (IDX directory or .npz)")
+    parser.add_argument("--split", default="test", choices=["train", "test"])
+    parser.add_argument("--calibration-data", help="Dataset for full_int8 calibration (default: --data train split, else --data)")
+    parser.add_argument("--variants", nargs="+", default=list(VARIANTS), choices=VARIANTS)
+    parser.add_argument("--output-dir", default="quantized")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--latency-runs", type=int, default=200)
+    parser.add_argument("--accuracy-floor", type=float, default=None,
+                        help="Report the smallest variant whose accuracy is at least this value")
+    parser.add_argument("--json", help="Also write the comparison to this JSON file")
+    args = parser.parse_args(argv)
+
+    images, labels = load_labeled_digits(args.data, args.split)
+    try:
+        calibration_images, _ = load_labeled_digits(args.calibration_data or args.data, "train")
+    except (FileNotFoundError, KeyError):
+        calibration_images = images
+    calibration_images = calibration_images[:CALIBRATION_SAMPLES]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(args.model))[0]
+    results = [dict(variant="keras", path=args.model, size_bytes=os.path.getsize(args.model),
+                    **benchmark_backend(KerasBackend(args.model), images, labels, args.batch_size, args.latency_runs))]
+
+    for variant in args.variants:
+        path = os.path.join(args.output_dir, f"{stem}_{variant}.tflite")
+        with open(path, "wb") as f:
+            f.write(quantize(args.model, variant, calibration_images))
+        results.append(dict(variant=variant, path=path, size_bytes=os.path.getsize(path),
+                            **benchmark_backend(TFLiteBackend(path), images, labels,
+                                                args.batch_size, args.latency_runs)))
+
+    print(f"\n{'variant':<14}{'size (KB)':>10}{'accuracy':>10}{'p50 ms':>9}{'p99 ms':>9}{'img/s':>11}")
+    for r in results:
+        print(f"{r['variant']:<14}{r['size_bytes'] / 1024:>10.0f}{r['accuracy'] * 100:>9.2f}%"
+              f"{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}{r['images_per_second']:>11,.0f}")
+
+    if args.accuracy_floor is not None:
+        passing = [r for r in results if r["accuracy"] >= args.accuracy_floor]
+        if passing:
+            best = min(passing, key=lambda r: r["size_bytes"])
+            print(f"\nSmallest model meeting the {args.accuracy_floor:.2%} floor: {best['path']}")
+        else:
+            print(f"\nNo variant meets the {args.accuracy_floor:.2%} accuracy floor")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
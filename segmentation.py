@@ -0,0 +1,139 @@
+"""Find every digit in an image and classify them all with one batched model call.
+
+Digits are separated with connected-component labeling (scipy.ndimage), small specks are
+dropped, pieces of the same digit that sit above each other (the bar of a 5, a detached
+stroke) are merged, and each digit is normalized MNIST-style: fit into a 20x20 box and
+centered by center of mass in a 28x28 frame.
+
+Usage:
+    python segmentation.py form.png --model best_model.keras
+"""
+import argparse
+import numpy as np
+from scipy import ndimage
+from PIL import Image
+
+from preprocessing import mnist_normalize, to_model_input
+
+INK_THRESHOLD = 64         # Minimum ink value (0-255, after inversion) counted as part of a stroke
+MIN_COMPONENT_AREA = 30    # Components smaller than this many pixels are treated as noise
+MERGE_OVERLAP = 0.5        # Merge components whose column ranges overlap by this fraction
+
+
+class DigitSegment:
+    """One digit found on the input: bounding box, normalized 28x28 image and prediction."""
+
+    def __init__(self, box, img_array):
+        self.box = box  # (left, top, right, bottom) in input pixel coordinates
+        self.img_array = img_array
+        self.probabilities = None
+
+    @property
+    def digit(self):
+        return int(np.argmax(self.probabilities))
+
+    @property
+    def confidence(self):
+        return float(np.max(self.probabilities))
+
+
+def ink_from_image(image):
+    """Dark-ink-on-light image (PIL or array) -> uint8 ink intensity (255 = full stroke)."""
+    if isinstance(image, Image.Image):
+        image = np.array(image.convert("L"))
+    return 255 - np.asarray(image, dtype=np.uint8)
+
+
+def find_digit_boxes(ink, threshold=INK_THRESHOLD, min_area=MIN_COMPONENT_AREA, merge_overlap=MERGE_OVERLAP):
+    """Label connected strokes and return (labels, [(component ids, (left, top, right, bottom))]).
+
+    Components are ordered left to right.
+    """
+    mask = ink >= threshold
+    labels, count = ndimage.label(mask, structure=np.ones((3, 3), dtype=bool))
+    if count == 0:
+        return labels, []
+
+    areas = np.bincount(labels.ravel(), minlength=count + 1)[1:]
+    slices = ndimage.find_objects(labels)
+    boxes = np.array([(s[1].start, s[0].start, s[1].stop, s[0].stop) for s in slices])
+    keep = np.nonzero(areas >= min_area)[0]
+    boxes = boxes[keep]
+    ids = [[int(i) + 1] for i in keep]
+
+    # Merge fragments stacked vertically over the same columns (e.g. the top bar of a 5)
+    order = np.argsort(boxes[:, 0], kind="stable")
+    groups = []
+    for index in order:
+        left, top, right, bottom = boxes[index]
+        if groups:
+            g_ids, (g_left, g_top, g_right, g_bottom) = groups[-1]
+            overlap = min(right, g_right) - max(left, g_left)
+            narrower = min(right - left, g_right - g_left)
+            if narrower > 0 and overlap / narrower >= merge_overlap:
+                groups[-1] = (g_ids + ids[index], (int(min(left, g_left)), int(min(top, g_top)),
+                                                    int(max(right, g_right)), int(max(bottom, g_bottom))))
+                continue
+        groups.append((ids[index], (int(left), int(top), int(right), int(bottom))))
+    return labels, groups
+
+
+def normalize_digits(ink_crops):
+    """MNIST-style normalization of each digit's ink crop, all in one batched call."""
+    if not ink_crops:
+        return []
+    # Zero padding to a common shape does not move a digit's bounding box or center of mass
+    stacked = np.zeros((len(ink_crops), max(c.shape[0] for c in ink_crops), max(c.shape[1] for c in ink_crops)),
+                       dtype=np.uint8)
+    for i, crop in enumerate(ink_crops):
+        stacked[i, :crop.shape[0], :crop.shape[1]] = crop
+    return list(mnist_normalize(stacked))
+
+
+def segment_digits(image, **kwargs):
+    """Split an image into DigitSegments (left to right), each with a normalized 28x28 array."""
+    ink = ink_from_image(image)
+    labels, groups = find_digit_boxes(ink, **kwargs)
+    crops = []
+    for component_ids, (left, top, right, bottom) in groups:
+        region = labels[top:bottom, left:right]
+        # Only this digit's own strokes; neighbours reaching into the box are masked out
+        crops.append(np.where(np.isin(region, component_ids), ink[top:bottom, left:right], 0).astype(np.uint8))
+    return [DigitSegment(box, img_array) for (_, box), img_array in zip(groups, normalize_digits(crops))]
+
+
+def classify_segments(backend, segments):
+    """Run all segments through `backend` in a single batched predict call."""
+    if segments:
+        probabilities = backend.predict(to_model_input(np.stack([s.img_array for s in segments])))
+        for segment, probs in zip(segments, probabilities):
+            segment.probabilities = probs
+    return segments
+
+
+def recognize_digits(backend, image, **kwargs):
+    """Segment and classify every digit in `image`; returns the DigitSegments left to right."""
+    return classify_segments(backend, segment_digits(image, **kwargs))
+
+
+def main(argv=None):
+    from backends import create_backend
+
+    parser = argparse.ArgumentParser(description="Recognize all digits in an image.")
+    parser.add_argument("images", nargs="+", help="Images with dark digits on a light background")
+    parser.add_argument("--model", default="best_model.keras")
+    parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None)
+    parser.add_argument("--min-area", type=int, default=MIN_COMPONENT_AREA)
+    args = parser.parse_args(argv)
+
+    backend = create_backend(args.backend, args.model)
+    for path in args.images:
+        with Image.open(path) as image:
+            segments = recognize_digits(backend, image, min_area=args.min_area)
+        digits = "".join(str(s.digit) for s in segments)
+        details = ", ".join(f"{s.digit}@{s.box} {s.confidence:.2f}" for s in segments)
+        print(f"{path}: {digits or '(no digits)'}  [{details}]")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Stroke recording for the drawing canvas: point arrays, simplification, undo/redo and replay.
+
+Each mouse drag becomes a Stroke (brush width plus the points the pointer visited). When the
+button is released the points are simplified with Ramer-Douglas-Peucker and the stroke is
+drawn as a single polyline, so the canvas holds one item per stroke instead of one per motion
+event. The history re-renders the PIL image from the strokes: undo re-renders all of it, a released
+stroke only the box it covers.
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+from preprocessing import CANVAS_SIZE
+
+SIMPLIFY_EPSILON = 1.0  # Max distance (canvas px) a dropped point may lie from the simplified line
+
+
+def simplify_points(points, epsilon=SIMPLIFY_EPSILON):
+    """Ramer-Douglas-Peucker simplification of an (N, 2) polyline; keeps the first and last point."""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    # Iterative rather than recursive: a long scribble would exceed the recursion limit
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        inner = points[start + 1:end]
+        dx, dy = b - a
+        length = np.hypot(dx, dy)
+        if length == 0:  # Closed loop (e.g. a 0): distance to the shared end point
+            distances = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            distances = np.abs(dx * (inner[:, 1] - a[1]) - dy * (inner[:, 0] - a[0])) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > epsilon:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return points[keep]
+
+
+class Stroke:
+    """One press-drag-release of the brush."""
+
+    def __init__(self, width, points=()):
+        self.width = width
+        self.points = list(points)
+        self.item = None  # Canvas item id once drawn as a polyline
+        self._bbox = None
+
+    def add(self, x, y):
+        self.points.append((x, y))
+        self._bbox = None
+
+    def simplify(self, epsilon=SIMPLIFY_EPSILON):
+        self.points = [tuple(p) for p in simplify_points(self.points, epsilon).tolist()]
+        self._bbox = None
+
+    def flat(self):
+        """Coordinates as x0, y0, x1, y1, ... (the form Tk and PIL line calls take)."""
+        return [c for point in self.points for c in point]
+
+    def bbox(self):
+        """(left, top, right, bottom) covered by the stroke, including the brush."""
+        if self._bbox is None:
+            xs, ys = zip(*self.points)
+            pad = self.width / 2 + 1
+            self._bbox = (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+        return self._bbox
+
+    def draw(self, draw):
+        draw.line(self.flat(), fill="black", width=self.width)
+        # Round joins and caps, as the canvas draws them (PIL's joint="round" leaves gaps on short segments)
+        radius = self.width / 2
+        for x, y in self.points:
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill="black")
+
+    def to_dict(self):
+        return {"width": self.width, "points": self.points}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["width"], [tuple(p) for p in data["points"]])
+
+
+class StrokeHistory:
+    """Finished strokes in drawing order, plus the stroke in progress and an undo (redo) stack."""
+
+    def __init__(self, epsilon=SIMPLIFY_EPSILON):
+        self.epsilon = epsilon
+        self.strokes = []
+        self.undone = []
+        self.current = None
+
+    def begin(self, width, x, y):
+        self.current = Stroke(width, [(x, y)])
+        return self.current
+
+    def end(self):
+        """Finish the current stroke; returns it simplified, or None if it never moved."""
+        stroke, self.current = self.current, None
+        if stroke is None or len(stroke.points) < 2:
+            return None
+        stroke.simplify(self.epsilon)
+        self.strokes.append(stroke)
+        self.undone.clear()
+        return stroke
+
+    def undo(self):
+        if not self.strokes:
+            return None
+        stroke = self.strokes.pop()
+        self.undone.append(stroke)
+        return stroke
+
+    def redo(self):
+        if not self.undone:
+            return None
+        stroke = self.undone.pop()
+        self.strokes.append(stroke)
+        return stroke
+
+    def clear(self):
+        self.strokes.clear()
+        self.undone.clear()
+        self.current = None
+
+    def __len__(self):
+        return len(self.strokes)
+
+    def __iter__(self):
+        return iter(self.strokes)
+
+    def render(self, size=CANVAS_SIZE):
+        """Replay the finished strokes onto a fresh white canvas image."""
+        image = Image.new("L", (size, size), "white")
+        draw = ImageDraw.Draw(image)
+        for stroke in self.strokes:
+            stroke.draw(draw)
+        return image
+
+    def render_region(self, image, box):
+        """Redraw `image` inside `box` from the finished strokes that overlap it, in place.
+
+        Overlapping strokes are drawn whole, at canvas coordinates, so the pixels match `render`
+        exactly; outside the box they only repaint ink that is already there.
+        """
+        left, top = max(int(box[0]), 0), max(int(box[1]), 0)
+        right, bottom = min(int(np.ceil(box[2])), image.width), min(int(np.ceil(box[3])), image.height)
+        if left >= right or top >= bottom:
+            return
+        image.paste(255, (left, top, right, bottom))
+        draw = ImageDraw.Draw(image)
+        for stroke in self.strokes:
+            s_left, s_top, s_right, s_bottom = stroke.bbox()
+            if s_left < right and s_right > left and s_top < bottom and s_bottom > top:
+                stroke.draw(draw)
+
+    def replay(self):
+        """Yield each stroke's segments (x0, y0, x1, y1, width) in drawing order."""
+        for stroke in self.strokes:
+            for (x0, y0), (x1, y1) in zip(stroke.points, stroke.points[1:]):
+                yield x0, y0, x1, y1, stroke.width
+
+    def to_list(self):
+        return [stroke.to_dict() for stroke in self.strokes]
+
+    @classmethod
+    def from_list(cls, data, epsilon=SIMPLIFY_EPSILON):
+        history = cls(epsilon)
+        history.strokes = [Stroke.from_dict(item) for item in data]
+        return history
@@ -0,0 +1,35 @@
+import os
+import numpy as np
+from PIL import Image
+
+from digit_dataset import DigitStore, ingest_images
+
+
+def test_append_after_interrupted_append_keeps_rows_aligned(tmp_path):
+    store = DigitStore.create(str(tmp_path))
+    store.append(np.ones((2, 28, 28), dtype=np.uint8), np.array([1, 1], dtype=np.uint8))
+    # An append killed after writing the image bytes but before meta.json was updated
+    with open(os.path.join(str(tmp_path), DigitStore.IMAGES_FILE), "ab") as f:
+        f.write(np.full((1, 28, 28), 9, dtype=np.uint8).tobytes())
+
+    store = DigitStore(str(tmp_path))
+    store.append(np.full((1, 28, 28), 7, dtype=np.uint8), np.array([7], dtype=np.uint8))
+
+    assert len(store) == 3
+    assert store.images[:, 0, 0].tolist() == [1, 1, 7]
+    assert store.labels.tolist() == [1, 1, 7]
+    assert os.path.getsize(os.path.join(str(tmp_path), DigitStore.IMAGES_FILE)) == 3 * 28 * 28
+
+
+def test_ingest_skips_unreadable_images(tmp_path):
+    os.makedirs(os.path.join(str(tmp_path), "digits", "7"))
+    Image.new("L", (280, 280), 255).save(os.path.join(str(tmp_path), "digits", "7", "a.png"))
+    with open(os.path.join(str(tmp_path), "digits", "7", "b.png"), "wb") as f:
+        f.write(b"not an image")
+    store = DigitStore.create(os.path.join(str(tmp_path), "store"))
+
+    added, failed = ingest_images(store, os.path.join(str(tmp_path), "digits"), workers=2)
+
+    assert added == 1
+    assert store.labels.tolist() == [7]
+    assert [os.path.basename(path) for path, _ in failed] == ["b.png"]
@@ -0,0 +1,28 @@
+import os
+import numpy as np
+from PIL import Image
+
+from benchmark import synthetic_strokes
+from inference import load_digits, stack_to_mnist
+from preprocessing import preprocess_image
+
+
+def test_unreadable_file_is_skipped_and_reported(tmp_path):
+    Image.new("L", (280, 280), 255).save(os.path.join(str(tmp_path), "a.png"))
+    with open(os.path.join(str(tmp_path), "b.png"), "wb") as f:
+        f.write(b"not an image")
+    np.save(os.path.join(str(tmp_path), "c.npy"), np.zeros((2, 28, 28), dtype=np.uint8))
+
+    names, images, failed = load_digits([str(tmp_path), np.zeros((1, 28, 28), dtype=np.uint8)], workers=2)
+
+    assert [os.path.basename(name) for name in names] == ["a.png", "c.npy[0]", "c.npy[1]", "array1[0]"]
+    assert images.shape == (4, 28, 28)
+    assert [os.path.basename(path) for path, _ in failed] == ["b.png"]
+
+
+def test_canvas_stack_matches_per_image_preprocessing():
+    canvases = [canvas for canvas, _ in synthetic_strokes(8)] + [Image.new("L", (280, 280), 255)]
+    stack = np.stack([np.array(canvas) for canvas in canvases])
+
+    expected = np.stack([preprocess_image(canvas) for canvas in canvases])
+    assert np.abs(stack_to_mnist(stack).astype(int) - expected).max() <= 1  # float32 rounding
@@ -0,0 +1,44 @@
+import os
+import numpy as np
+
+from model_registry import ModelRegistry, RegistryWatcher
+
+
+def _publish(registry, tmp_path, name):
+    model_path = os.path.join(str(tmp_path), name)
+    np.savez(model_path, kernel_0=np.zeros((784, 10), dtype=np.float32), bias_0=np.zeros(10, dtype=np.float32),
+             activation_0=np.array("softmax"))
+    return registry.publish(model_path, backend="numpy")
+
+
+def test_rollback_returns_to_previously_active_versions(tmp_path):
+    registry = ModelRegistry(os.path.join(str(tmp_path), "models"))
+    v1, v2, v3 = (_publish(registry, tmp_path, f"model{i}.npz") for i in range(3))
+    registry.set_active(v1)
+
+    assert registry.rollback() == v3
+    assert registry.rollback() == v2
+    assert registry.rollback() == v1
+    assert registry.active_version() == v1
+
+
+def test_watcher_falls_back_without_reporting_nothing_loadable(tmp_path):
+    registry = ModelRegistry(os.path.join(str(tmp_path), "models"))
+    v1 = _publish(registry, tmp_path, "good.npz")
+    v2 = _publish(registry, tmp_path, "broken.npz")
+    with open(registry.model_path(v2), "wb") as f:
+        f.write(b"corrupted after publishing")
+    loaded, errors = [], []
+    watcher = RegistryWatcher(registry, lambda backend, version, metadata: loaded.append(version),
+                              lambda version, e: errors.append(version))
+
+    assert watcher.check_once()
+    assert loaded == [v1]
+    assert errors == [v2]
+
+    with open(registry.model_path(v1), "wb") as f:
+        f.write(b"corrupted too")
+    watcher = RegistryWatcher(registry, lambda backend, version, metadata: loaded.append(version),
+                              lambda version, e: errors.append(version))
+    assert not watcher.check_once()
+    assert errors[-1] is None
@@ -0,0 +1,20 @@
+import os
+import numpy as np
+
+from prediction_cache import PredictionCache
+
+
+def test_model_change_is_noticed_once_the_check_interval_passes(tmp_path):
+    model_path = os.path.join(str(tmp_path), "model.npz")
+    with open(model_path, "wb") as f:
+        f.write(b"v1")
+    cache = PredictionCache(model_path=model_path, check_interval=3600)
+    image = np.zeros((28, 28), dtype=np.uint8)
+    cache.put(image, np.full(10, 0.1))
+    with open(model_path, "wb") as f:
+        f.write(b"version 2")
+
+    assert cache.get(image) is not None  # Within the interval the file is not checked
+    cache.check_interval = 0
+    assert cache.get(image) is None
+    assert cache.stats()["invalidations"] == 1
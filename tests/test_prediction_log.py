@@ -0,0 +1,26 @@
+import numpy as np
+
+from prediction_log import PredictionLog, PredictionLogWriter
+
+
+def test_correction_after_failed_write_labels_the_right_row(tmp_path):
+    writer = PredictionLogWriter(str(tmp_path), batch_size=1)
+    append = writer.log.append_columns
+    calls = []
+
+    def append_failing_second(columns, source=None):
+        calls.append(len(columns["images"]))
+        if len(calls) == 2:
+            raise OSError("disk full")
+        append(columns, source)
+
+    writer.log.append_columns = append_failing_second
+    image = np.zeros((28, 28), dtype=np.uint8)
+    probabilities = np.eye(10)[3]
+    for label in (1, 5, 8):  # The prediction corrected to 5 is never written
+        writer.correct(writer.record(image, probabilities, "v1"), label)
+    writer.close()
+
+    log = PredictionLog(str(tmp_path))
+    assert len(log) == 2
+    assert log.labels.tolist() == [1, 8]
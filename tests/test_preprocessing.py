@@ -0,0 +1,27 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmark import synthetic_strokes
+from preprocessing import IncrementalRaster, preprocess_canvas_image, preprocess_image
+
+
+def test_incremental_raster_matches_full_preprocessing():
+    for seed in range(10):
+        image = Image.new("L", (280, 280), "white")
+        draw = ImageDraw.Draw(image)
+        raster = IncrementalRaster()
+        for _, segments in synthetic_strokes(3, seed=seed, segments=15):
+            for step, (x0, y0, x1, y1, width) in enumerate(segments):
+                draw.line([x0, y0, x1, y1], fill="black", width=width, joint="round")
+                raster.mark_line(x0, y0, x1, y1, width)
+                if step % 5 == 4:
+                    assert np.array_equal(raster.update(image), preprocess_canvas_image(image))
+                    assert np.array_equal(raster.normalized(image), preprocess_image(image))
+
+
+def test_incremental_raster_starts_blank():
+    image = Image.new("L", (280, 280), "white")
+    raster = IncrementalRaster()
+
+    assert np.array_equal(raster.update(image), preprocess_canvas_image(image))
+    assert not raster.normalized(image).any()
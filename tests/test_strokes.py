@@ -0,0 +1,23 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmark import synthetic_strokes
+from strokes import StrokeHistory
+
+
+def test_render_region_after_each_release_matches_full_render():
+    for seed in range(10):
+        history = StrokeHistory()
+        image = Image.new("L", (280, 280), "white")
+        draw = ImageDraw.Draw(image)
+        for _, segments in synthetic_strokes(4, seed=seed, segments=20):
+            # As the app does while dragging: raw segments on the image, points on the stroke
+            history.begin(segments[0][4], *segments[0][:2])
+            for x0, y0, x1, y1, width in segments:
+                draw.line([x0, y0, x1, y1], fill="black", width=width, joint="round")
+                history.current.add(x1, y1)
+            released_box = history.current.bbox()
+            history.end()
+            history.render_region(image, released_box)
+
+            assert np.array_equal(np.array(image), np.array(history.render()))
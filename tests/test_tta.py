@@ -0,0 +1,25 @@
+import numpy as np
+
+from tta import calibrate_threshold
+
+
+def _probabilities(digits, confidences):
+    probabilities = np.full((len(digits), 10), 0.0)
+    for row, (digit, confidence) in enumerate(zip(digits, confidences)):
+        probabilities[row] = (1 - confidence) / 9
+        probabilities[row, digit] = confidence
+    return probabilities
+
+
+def test_calibrated_threshold_keeps_single_pass_accuracy_of_accepted_predictions():
+    labels = np.array([0, 1, 2, 3])
+    # Single pass: the two confident answers are right, so accepted predictions are 100% accurate
+    single = _probabilities([0, 1, 5, 5], [0.99, 0.95, 0.5, 0.4])
+    # TTA: same answers at lower confidence, plus a correct third one and a wrong fourth
+    tta = _probabilities([0, 1, 2, 5], [0.9, 0.8, 0.62, 0.6])
+
+    threshold = calibrate_threshold(single, tta, labels)
+
+    assert threshold == 0.62
+    assert np.mean(tta.max(axis=1) < 0.7) == 0.5
+    assert np.mean(tta.max(axis=1) < threshold) == 0.25
@@ -0,0 +1,250 @@
+"""Train the digit classifier from the command line (replaces the notebook cells).
+
+Same network and optimizer as `train_mnist.ipynb` (Dense 512 relu -> Dense 10 softmax, rmsprop),
+fed by a tf.data pipeline: row indices are shuffled and batched, each batch gathers its uint8
+digits from the data (a DigitStore stays memory-mapped, so it is never loaded whole) and is
+augmented on the fly (shift, rotation, stroke thickness) by a parallel map, with prefetching so
+the CPU prepares the next batches while the model trains on the current one.
+
+Data can be a DigitStore built by `digit_dataset.py` (e.g. MNIST plus your saved digits), a
+directory of MNIST IDX files or a `.npz` archive.
+
+Usage:
+    python train.py --data data/train --val-data data/test
+    python train.py --data ~/datasets/mnist --epochs 30 --output best_model.keras
+"""
+import os
+import json
+import math
+import time
+import argparse
+import numpy as np
+
+from digit_dataset import DigitStore, load_labeled_digits, UNLABELED
+from preprocessing import PREDICTION_IMAGE_SIZE
+
+MAX_SHIFT = 2.0             # Pixels (at 28x28) a digit is moved in x and y
+MAX_ROTATION_DEGREES = 12.0
+# The app's brush is 10-30 px on the 280 canvas, i.e. 1-3 px after downscaling; strokes are
+# thinned or thickened by up to one pixel of erosion/dilation to cover that range
+MAX_THICKNESS_CHANGE = 1.0
+GATHER_SIZE = 4096             # Rows read per memory-map gather while filling a --cache-file
+CACHE_SHUFFLE_BUFFER = 65536   # Digits held for shuffling when training from a --cache-file
+
+
+def open_training_data(path, split="train"):
+    """(images, labels, indices of the labelled rows) from a DigitStore, IDX directory or .npz.
+
+    A DigitStore's columns stay memory-mapped; nothing is read until rows are gathered.
+    """
+    path = os.path.expanduser(path)
+    if os.path.exists(os.path.join(path, DigitStore.META_FILE)):
+        store = DigitStore(path)
+        return store.images, store.labels, store.labeled_indices()
+    images, labels = load_labeled_digits(path, split)
+    return images, labels, np.flatnonzero(labels != UNLABELED)
+
+
+def load_training_data(path, split="train"):
+    """(images uint8 (N, 28, 28), labels uint8 (N,)) of the labelled digits, read into memory."""
+    images, labels, indices = open_training_data(path, split)
+    return np.asarray(images[indices]), np.asarray(labels[indices])
+
+
+def build_model():
+    """The notebook's network, taking (28, 28, 1) inputs like the bundled best_model.keras."""
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    model = keras.Sequential([
+        keras.Input(shape=(PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1)),
+        layers.Flatten(),
+        layers.Dense(512, activation="relu"),
+        layers.Dense(10, activation="softmax"),
+    ])
+    model.compile(optimizer="rmsprop",
+                  loss="sparse_categorical_crossentropy",
+                  metrics=["accuracy"])
+    return model
+
+
+def augment_batch(images, seed, max_shift=MAX_SHIFT, max_rotation=MAX_ROTATION_DEGREES,
+                  max_thickness=MAX_THICKNESS_CHANGE):
+    """Randomly shift, rotate and thin/thicken a float (B, 28, 28, 1) batch.
+
+    Uses stateless random ops seeded per batch, so a run is reproducible even though batches
+    are augmented in parallel.
+    """
+    import tensorflow as tf
+
+    batch = tf.shape(images)[0]
+    angle_seed, shift_seed, thickness_seed = tf.unstack(tf.random.experimental.stateless_split(seed, 3))
+    angle = tf.random.stateless_uniform([batch], angle_seed, -1.0, 1.0) * (max_rotation * math.pi / 180)
+    shift = tf.random.stateless_uniform([batch, 2], shift_seed, -max_shift, max_shift)
+
+    # Rotation about the image center followed by a shift, as the output -> input mapping
+    # expected by ImageProjectiveTransform: [a0, a1, a2, b0, b1, b2, c0, c1]
+    center = (PREDICTION_IMAGE_SIZE - 1) / 2
+    cos, sin = tf.cos(angle), tf.sin(angle)
+    x0, y0 = center + shift[:, 0], center + shift[:, 1]
+    zeros = tf.zeros_like(angle)
+    transforms = tf.stack([cos, sin, center - cos * x0 - sin * y0,
+                           -sin, cos, center + sin * x0 - cos * y0,
+                           zeros, zeros], axis=1)
+    images = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms,
+        output_shape=[PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE],
+        fill_value=0.0, interpolation="BILINEAR", fill_mode="CONSTANT")
+
+    # Stroke thickness: blend towards a 3x3 dilation (thicker) or erosion (thinner)
+    thickness = tf.random.stateless_uniform([batch, 1, 1, 1], thickness_seed, -max_thickness, max_thickness)
+    dilated = tf.nn.max_pool2d(images, 3, 1, "SAME")
+    eroded = -tf.nn.max_pool2d(-images, 3, 1, "SAME")
+    images = tf.where(thickness > 0,
+                      images + thickness * (dilated - images),
+                      images - thickness * (eroded - images))
+    return tf.clip_by_value(images, 0.0, 1.0)
+
+
+def make_dataset(images, labels, indices, batch_size, training, seed=0, augment=True, cache=None):
+    """tf.data pipeline: shuffle row indices -> batch -> gather rows -> parallel augment/normalize -> prefetch.
+
+    Only the row indices go through shuffling; each batch then reads its rows from `images`
+    and `labels` (arrays or a DigitStore's memory maps), so the dataset is never copied into
+    the pipeline. With `cache`, the gathered digits are also written to that file once and
+    later epochs shuffle them with a CACHE_SHUFFLE_BUFFER window. Training datasets repeat
+    forever; pass `steps_per_epoch` to fit.
+    """
+    import tensorflow as tf
+
+    def normalize(batch):
+        return tf.expand_dims(tf.cast(batch, tf.float32) / 255.0, -1)
+
+    def read_rows(rows):
+        rows = np.sort(rows)  # Ascending reads from the memory map; the batch order does not matter
+        return np.asarray(images[rows], dtype=np.uint8), np.asarray(labels[rows], dtype=np.uint8)
+
+    def gather(rows):
+        batch_images, batch_labels = tf.numpy_function(read_rows, [rows], [tf.uint8, tf.uint8])
+        batch_images.set_shape([None, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE])
+        batch_labels.set_shape([None])
+        return batch_images, batch_labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if not training:
+        return (dataset.batch(batch_size)
+                .map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+                .map(lambda x, y: (normalize(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+                .prefetch(tf.data.AUTOTUNE))
+
+    if cache:
+        dataset = (dataset.batch(GATHER_SIZE).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+                   .unbatch().cache(cache))
+        dataset = dataset.shuffle(min(len(indices), CACHE_SHUFFLE_BUFFER), seed=seed,
+                                  reshuffle_each_iteration=True).repeat()
+        dataset = dataset.batch(batch_size, drop_remainder=True)
+    else:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True).repeat()
+        dataset = dataset.batch(batch_size, drop_remainder=True)
+        dataset = dataset.map(gather, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    if augment:
+        # The batch counter gives every batch (across epochs) its own stateless seed
+        dataset = tf.data.Dataset.zip((dataset, tf.data.Dataset.counter()))
+        dataset = dataset.map(
+            lambda batch, step: (augment_batch(normalize(batch[0]), tf.stack([tf.cast(seed, tf.int64), step])),
+                                 batch[1]),
+            num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    else:
+        dataset = dataset.map(lambda x, y: (normalize(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def throughput_callback(batch_size, steps_per_epoch):
+    """Keras callback that logs each epoch's wall time and training samples/sec."""
+    from tensorflow import keras
+
+    class EpochThroughput(keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.epoch_start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            elapsed = time.perf_counter() - self.epoch_start
+            if logs is not None:
+                logs["epoch_time_s"] = elapsed
+                logs["samples_per_sec"] = batch_size * steps_per_epoch / elapsed
+            print(f"Epoch {epoch + 1}: {elapsed:.1f}s, {batch_size * steps_per_epoch / elapsed:,.0f} samples/sec")
+
+    return EpochThroughput()
+
+
+def train(args):
+    from tensorflow import keras
+
+    keras.utils.set_random_seed(args.seed)
+    images, labels, indices = open_training_data(args.data, "train")
+    if args.val_data:
+        val_images, val_labels, val_indices = open_training_data(args.val_data, "test")
+    else:
+        # Split the row indices; both sets keep reading from the same arrays
+        order = np.random.default_rng(args.seed).permutation(indices)
+        split = int(len(order) * (1 - args.val_fraction))
+        val_images, val_labels, val_indices = images, labels, np.sort(order[split:])
+        indices = np.sort(order[:split])
+    print(f"Training on {len(indices)} digits, validating on {len(val_indices)}")
+
+    steps_per_epoch = max(1, len(indices) // args.batch_size)
+    train_dataset = make_dataset(images, labels, indices, args.batch_size, training=True, seed=args.seed,
+                                 augment=not args.no_augment, cache=args.cache_file)
+    val_dataset = make_dataset(val_images, val_labels, val_indices, args.batch_size, training=False)
+
+    if args.resume and os.path.exists(args.output):
+        model = keras.models.load_model(args.output)
+        print(f"Resuming from {args.output}")
+    else:
+        model = build_model()
+
+    callbacks = [
+        throughput_callback(args.batch_size, steps_per_epoch),
+        # Interrupted runs continue from the last finished epoch when restarted
+        keras.callbacks.BackupAndRestore(args.checkpoint_dir),
+        keras.callbacks.ModelCheckpoint(args.output, monitor="val_accuracy", save_best_only=True),
+        keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=args.patience,
+                                      restore_best_weights=True),
+    ]
+    start = time.perf_counter()
+    history = model.fit(train_dataset, validation_data=val_dataset, epochs=args.epochs,
+                        steps_per_epoch=steps_per_epoch, callbacks=callbacks, verbose=2)
+    total = time.perf_counter() - start
+
+    best = int(np.argmax(history.history["val_accuracy"]))
+    print(f"Best val accuracy {history.history['val_accuracy'][best] * 100:.2f}% at epoch {best + 1}; "
+          f"model saved to {args.output} ({total:.1f}s total)")
+    if args.history:
+        with open(args.history, "w") as f:
+            json.dump({"args": vars(args), "total_time_s": total,
+                       "history": {k: [float(v) for v in values] for k, values in history.history.items()}},
+                      f, indent=2)
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the MNIST digit classifier.")
+    parser.add_argument("--data", required=True, help="DigitStore directory, MNIST IDX directory or .npz")
+    parser.add_argument("--val-data", default=None, help="Validation set (test split); default: hold out --val-fraction")
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument("--output", default="best_model.keras", help="Best model (by val accuracy) is saved here")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--patience", type=int, default=5, help="Early stopping patience in epochs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-augment", action="store_true")
+    parser.add_argument("--cache-file", default=None,
+                        help="Also cache the digits in this file (default: read rows straight from the data)")
+    parser.add_argument("--checkpoint-dir", default="checkpoints", help="Backup used to resume interrupted runs")
+    parser.add_argument("--resume", action="store_true", help="Continue training the model at --output")
+    parser.add_argument("--history", default=None, help="Write per-epoch metrics and timings to this JSON file")
+    train(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Test-time augmentation (TTA) and model ensembles evaluated as one batched forward pass.
+
+Each input is expanded into K variants (small shifts, rescales, thinner/thicker strokes) of the
+preprocessed 28x28 digit; all N x K variants go through each model in a single batched call and
+the probabilities are averaged. Off-center or thin drawings that a single pass scores below the
+app's confidence threshold are often recovered, at close to the cost of one call.
+
+Usage:
+    python tta.py                                   # bundled screenshot digits
+    python tta.py --data data/test --ensemble quantized/best_model_float16.tflite
+    python tta.py --variants identity shift:1:0 shift:-1:0 scale:1.1 thickness:0.5
+"""
+import time
+import argparse
+import numpy as np
+from scipy import ndimage
+
+from backends import InferenceBackend
+from inference import LatencyTracker
+from preprocessing import PREDICTION_IMAGE_SIZE, to_model_input
+
+# ("identity",), ("shift", dx, dy) in pixels, ("scale", factor) about the center,
+# ("thickness", t): blend towards a 3x3 dilation (t > 0) or erosion (t < 0), as in train.py
+DEFAULT_VARIANTS = (
+    ("identity",),
+    ("shift", 1, 0), ("shift", -1, 0), ("shift", 0, 1), ("shift", 0, -1),
+    ("scale", 0.9), ("scale", 1.1),
+    ("thickness", 0.5), ("thickness", -0.5),
+)
+CONFIDENCE_THRESHOLD = 0.7  # Same as the app: below this a prediction is shown as "Unknown"
+# Averaging the variants pulls confident answers down, so TTA gets its own threshold, calibrated
+# with `calibrate_threshold` (`python tta.py --data ...` reports it for your model and data)
+TTA_CONFIDENCE_THRESHOLD = 0.62
+
+
+def parse_variant(text):
+    """'shift:1:0' -> ('shift', 1, 0); 'scale:1.1' -> ('scale', 1.1)."""
+    kind, *params = text.split(":")
+    if kind not in ("identity", "shift", "scale", "thickness"):
+        raise ValueError(f"Unknown TTA variant {text!r}")
+    return (kind,) + tuple(int(p) if kind == "shift" else float(p) for p in params)
+
+
+def apply_variant(images, variant):
+    """Apply one variant to a whole (N, 28, 28) float stack at once."""
+    kind = variant[0]
+    if kind == "identity":
+        return images
+    if kind == "shift":
+        dx, dy = variant[1:]
+        shifted = np.zeros_like(images)
+        height, width = images.shape[1:]
+        shifted[:, max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)] = \
+            images[:, max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+        return shifted
+    if kind == "scale":
+        inverse = 1.0 / variant[1]
+        center = (PREDICTION_IMAGE_SIZE - 1) / 2
+        # Output pixel p samples the input at center + (p - center) / factor; axis 0 is the batch
+        return ndimage.affine_transform(images, [1.0, inverse, inverse],
+                                        offset=[0.0, center * (1 - inverse), center * (1 - inverse)],
+                                        order=1, mode="constant", cval=0.0)
+    amount = variant[1]
+    if amount >= 0:
+        target = ndimage.grey_dilation(images, size=(1, 3, 3))
+    else:
+        target = ndimage.grey_erosion(images, size=(1, 3, 3))
+    return images + abs(amount) * (target - images)
+
+
+def make_variants(images, variants=DEFAULT_VARIANTS):
+    """(N, 28, 28[, 1]) -> (N, K, 28, 28) float32 stack of augmented copies, same value range."""
+    images = np.asarray(images, dtype=np.float32).reshape(-1, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE)
+    stacked = np.empty((len(images), len(variants), PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE),
+                       dtype=np.float32)
+    for k, variant in enumerate(variants):
+        stacked[:, k] = apply_variant(images, variant)
+    return stacked
+
+
+class TTABackend(InferenceBackend):
+    """Average the predictions of every variant of every input over one or more models.
+
+    Each model sees all N x K variants in one `predict` call, so the cost grows with batch
+    size rather than with K sequential calls.
+    """
+
+    def __init__(self, backends, variants=DEFAULT_VARIANTS):
+        self.backends = list(backends) if isinstance(backends, (list, tuple)) else [backends]
+        self.variants = tuple(variants)
+
+    @property
+    def name(self):
+        return f"{'+'.join(b.name for b in self.backends)} (TTA x{len(self.variants)})"
+
+    def predict(self, batch):
+        stacked = make_variants(batch, self.variants)
+        count, k = stacked.shape[:2]
+        model_input = stacked.reshape(count * k, PREDICTION_IMAGE_SIZE, PREDICTION_IMAGE_SIZE, 1)
+        probabilities = np.zeros((count, 10), dtype=np.float64)
+        for backend in self.backends:
+            probabilities += np.asarray(backend.predict(model_input)).reshape(count, k, 10).mean(axis=1)
+        return (probabilities / len(self.backends)).astype(np.float32)
+
+
+def measure_tta_cost(backend, tta_backend, sample, runs=200):
+    """p50 latency of one input without and with TTA, and the added cost per extra variant."""
+    trackers = {"single": LatencyTracker(runs), "tta": LatencyTracker(runs)}
+    for name, engine in (("single", backend), ("tta", tta_backend)):
+        engine.predict(sample)  # Warm-up (traces a new batch shape for graph backends)
+        for _ in range(runs):
+            start = time.perf_counter()
+            engine.predict(sample)
+            trackers[name].record(time.perf_counter() - start)
+    single, tta = trackers["single"].percentile(50), trackers["tta"].percentile(50)
+    forward_passes = len(tta_backend.variants) * len(tta_backend.backends)
+    return {
+        "single_p50_ms": single,
+        "tta_p50_ms": tta,
+        "forward_passes": forward_passes,
+        "per_extra_variant_ms": (tta - single) / max(forward_passes - 1, 1),
+        "sequential_estimate_ms": single * forward_passes,
+    }
+
+
+def calibrate_threshold(single_probabilities, tta_probabilities, labels, threshold=CONFIDENCE_THRESHOLD):
+    """Lowest TTA confidence threshold whose accepted predictions are at least as accurate as
+    the single pass's at `threshold`, so "Unknown" keeps its meaning without hiding more answers.
+    """
+    single_accepted = np.max(single_probabilities, axis=1) >= threshold
+    if not single_accepted.any():
+        return threshold
+    target = np.mean(np.argmax(single_probabilities, axis=1)[single_accepted] == labels[single_accepted])
+    # Accuracy of the k most confident TTA predictions, for every k
+    confidences = np.max(tta_probabilities, axis=1)
+    order = np.argsort(-confidences, kind="stable")
+    correct = (np.argmax(tta_probabilities, axis=1) == labels)[order]
+    accuracy = np.cumsum(correct) / np.arange(1, len(order) + 1)
+    reached = np.flatnonzero(accuracy >= target)
+    if not len(reached):
+        return threshold
+    if reached[-1] == len(order) - 1:
+        # Every prediction can be accepted: the data sets no lower bound
+        return min(threshold, float(confidences.min()))
+    return float(confidences[order][reached[-1]])
+
+
+def compare_accuracy(backend, tta_backend, images, labels, threshold=CONFIDENCE_THRESHOLD,
+                     tta_threshold=TTA_CONFIDENCE_THRESHOLD, batch_size=256):
+    """Accuracy and share of below-threshold ("Unknown") predictions, without and with TTA.
+
+    TTA is scored at the single-pass threshold, at `tta_threshold` and at the threshold
+    calibrated on this data.
+    """
+    report, probabilities = {}, {}
+    for name, engine in (("single", backend), ("tta", tta_backend)):
+        probabilities[name] = np.concatenate([engine.predict(to_model_input(images[i:i + batch_size]))
+                                              for i in range(0, len(images), batch_size)])
+        report[name] = {
+            "accuracy": float(np.mean(np.argmax(probabilities[name], axis=1) == labels)),
+            "unknown_rate": float(np.mean(np.max(probabilities[name], axis=1) < threshold)),
+        }
+    calibrated = calibrate_threshold(probabilities["single"], probabilities["tta"], labels, threshold)
+    tta_confidences = np.max(probabilities["tta"], axis=1)
+    report["tta"].update({
+        "unknown_rate_tta_threshold": float(np.mean(tta_confidences < tta_threshold)),
+        "calibrated_threshold": calibrated,
+        "unknown_rate_calibrated": float(np.mean(tta_confidences < calibrated)),
+    })
+    return report
+
+
+def main(argv=None):
+    from backends import create_backend
+
+    parser = argparse.ArgumentParser(description="Measure test-time augmentation / ensemble accuracy and latency.")
+    parser.add_argument("--model", default="best_model.keras")
+    parser.add_argument("--backend", choices=["keras", "tflite", "numpy"], default=None)
+    parser.add_argument("--ensemble", nargs="*", default=[], help="Extra model files averaged with --model")
+    parser.add_argument("--variants", nargs="+", default=None, help="e.g. identity shift:1:0 scale:0.9 thickness:0.5")
+    parser.add_argument("--data", default=None, help="DigitStore, IDX directory or .npz (default: bundled screenshots)")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    if args.data:
+        from train import load_training_data
+        images, labels = load_training_data(args.data, "test")
+        images, labels = images[:args.samples], labels[:args.samples]
+    else:
+        from benchmark import load_sample_fixtures
+        from preprocessing import preprocess_image
+        fixtures = [(canvas, label) for _, canvas, label in load_sample_fixtures() if label is not None]
+        images = np.stack([preprocess_image(canvas) for canvas, _ in fixtures])
+        labels = np.array([label for _, label in fixtures])
+
+    backend = create_backend(args.backend, args.model)
+    variants = [parse_variant(v) for v in args.variants] if args.variants else DEFAULT_VARIANTS
+    tta_backend = TTABackend([backend] + [create_backend(None, path) for path in args.ensemble], variants)
+
+    print(f"{tta_backend.name} on {len(images)} digits")
+    report = compare_accuracy(backend, tta_backend, images, labels)
+    for name, result in report.items():
+        print(f"  {name:<6} accuracy {result['accuracy'] * 100:6.2f}%   unknown (<{CONFIDENCE_THRESHOLD}) "
+              f"{result['unknown_rate'] * 100:5.1f}%")
+    tta = report["tta"]
+    print(f"  TTA unknown (<{TTA_CONFIDENCE_THRESHOLD}, app --tta threshold) "
+          f"{tta['unknown_rate_tta_threshold'] * 100:5.1f}%; calibrated threshold on this data "
+          f"{tta['calibrated_threshold']:.3f} ({tta['unknown_rate_calibrated'] * 100:.1f}% unknown)")
+    cost = measure_tta_cost(backend, tta_backend, to_model_input(images[:1]), args.runs)
+    print(f"  latency p50: single {cost['single_p50_ms']:.2f} ms, TTA {cost['tta_p50_ms']:.2f} ms "
+          f"({cost['forward_passes']} forward passes, +{cost['per_extra_variant_ms']:.3f} ms per extra variant; "
+          f"sequential calls would take ~{cost['sequential_estimate_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()